@@ -1,9 +1,17 @@
+import collections
+import contextlib
 import enum
-import numpy as np
-from numpy.lib.recfunctions import append_fields
 from datetime import datetime, timedelta
+import io
+import os
+import queue
 import struct
 import logging
+import threading
+import time
+
+# numpy is imported inside the functions that build arrays, so that header
+# parsing and streaming with iter_bin(skip_wfm=True) do not pay for it
 
 
 class EventType(enum.Enum):
@@ -20,8 +28,12 @@ CHID_to_str = {
     4: 'ENER',
     5: 'DURATION',
     6: 'AMP',
+    7: 'RMS8',
     8: 'ASL',
+    9: 'GAIN',
     10: 'THR',
+    11: 'PA-CURRENT',
+    12: 'LOST HITS',
     13: 'A-FRQ',
     17: 'RMS',
     18: 'R-FRQ',
@@ -40,8 +52,12 @@ CHID_byte_len = {
     4: 2,
     5: 4,
     6: 1,
+    7: 1,
     8: 1,
+    9: 1,
     10: 1,
+    11: 1,
+    12: 4,
     13: 2,
     17: 2,
     18: 2,
@@ -54,12 +70,30 @@ CHID_byte_len = {
     31: 2}
 
 
+# Column holding the time of each row in the rec, wfm and td tables
+TIME = 'SSSSSSSS.mmmuuun'
+
+
 def _bytes_to_RTOT(bytes):
     """Helper function to convert a 6-byte sequence to a time offset"""
     (i1, i2) = struct.unpack('IH', bytes)
     return ((i1+2**32*i2)*.25e-6)
 
 
+def _amp_scale_factor(gain):
+    """Volts per waveform count for a channel gain in dB"""
+    MaxInput = 10.0
+    Gain = 10**(gain/20)
+    MaxCounts = 32768.0
+    return MaxInput/(Gain*MaxCounts)
+
+
+def _td_cids(names):
+    """Sorted CIDs of the ``CID<n>_<feature>`` columns of a td table"""
+    return sorted({int(n[3:n.index('_')]) for n in names
+                   if n.startswith('CID')})
+
+
 def _decode_td_fv(fv_bytes, demand_chid_list, partial_power_segments):
     """Decode a time-driven feature vector into a dict of named values.
 
@@ -74,6 +108,10 @@ def _decode_td_fv(fv_bytes, demand_chid_list, partial_power_segments):
             n = partial_power_segments
             values[name] = fv_bytes[offset:offset+n]
             offset += n
+        elif chid == 7:  # RMS8: uint8 / 20
+            [v] = struct.unpack_from('B', fv_bytes, offset)
+            values[name] = v / 20.0
+            offset += 1
         elif chid == 17:  # RMS: uint16 / 5000
             [v] = struct.unpack_from('H', fv_bytes, offset)
             values[name] = v / 5000.0
@@ -105,267 +143,642 @@ def _decode_td_fv(fv_bytes, demand_chid_list, partial_power_segments):
     return values
 
 
-def iter_bin(files, skip_wfm=False, include_td=True):
-    """Generator that streams parsed events from one or more .DTA files.
+SkippedRange = collections.namedtuple(
+    'SkippedRange', ['file', 'start', 'end', 'reason'])
+SkippedRange.__doc__ = """Byte range ``[start, end)`` of ``file`` skipped by
+:func:`iter_bin` in resync mode, with the reason it was rejected."""
 
-    Yields ``(type, data)`` tuples as events are encountered in the byte
-    stream, keeping memory usage constant regardless of file size.  The
-    header / setup portion of the first file is consumed internally by
-    :func:`_read_config`; only data events are yielded.
+# Upper bound on parametric channels appended to a hit (MID 1)
+_MAX_HIT_PARAMETRICS = 16
 
-    Args:
-        files (str or list): path to a .DTA file, or list of paths for
-            continuation files (state is shared across files)
-        skip_wfm (bool): do not yield waveform events if True
-        include_td (bool): yield time-driven events if True
+# Bytes read at a time while searching for the next plausible message
+_RESYNC_WINDOW = 1 << 16
 
-    Yields:
-        ``(EventType.HIT, record)`` — flat list matching a row of the rec
-            recarray: ``[RTOT, CID, *CHID_values, *PARAM_values]``
+# Number of consecutive plausible messages required to resynchronize
+_RESYNC_CHAIN = 3
 
-        ``(EventType.TIME_DRIVEN, record)`` — flat list matching a row of
-            the td recarray: ``[RTOT, *PID_values, *CID_FV_values]``
+# Messages found between data messages: hits, time-driven data, continued
+# file, reset, start/stop/pause, waveforms, and the status messages AEwin
+# writes during acquisition (10, 15, 21, 208)
+_STREAM_MIDS = frozenset((1, 2, 3, 8, 10, 11, 15, 21, 128, 129, 130, 173,
+                          208))
 
-        ``(EventType.WAVEFORM, record)`` — flat list:
-            ``[RTOT, CID, SRATE, TDLY, numpy.ndarray]``
+# Setup messages, only found in the data stream after MID 8
+_SETUP_MIDS = frozenset((7, 38, 41, 42, 44, 49, 99, 107, 109, 116))
+
+
+def _frame_checker(config):
+    """Build a function that validates a message against the lengths
+    implied by the setup in config.
+
+    The returned ``check(MID, body, in_setup=False)`` gets the message
+    body following the MID byte and returns None for a plausible message,
+    otherwise a short reason.  MIDs outside ``_STREAM_MIDS`` are rejected,
+    except for ``_SETUP_MIDS`` while ``in_setup`` (after MID 8 and before
+    the MID 11 that ends the setup record).  Messages without a known
+    layout are accepted as long as they are not empty.
     """
-    if isinstance(files, str):
-        files = [files]
+    partial_power_segments = config["partial_power_segments"]
 
-    config = None
+    def chid_len(chid):
+        if chid == 22:
+            return partial_power_segments
+        return CHID_byte_len.get(chid)
+
+    hit_lens = [chid_len(c) for c in config["chid_list"]]
+    hit_len = None if None in hit_lens else sum(hit_lens)
+    fv_len = sum(chid_len(c) or 0 for c in config["demand_chid_list"])
+    n_pid = len(config["demand_pid_list"])
+    channels = set(config["gain"]) | set(config["hardware_cfg"])
+
+    def check(MID, body, in_setup=False):
+        n = len(body)
+        if MID not in _STREAM_MIDS and not (in_setup and MID in _SETUP_MIDS):
+            return "unknown message ID %d" % MID
+        if MID == 1:
+            if hit_len is None:
+                return None
+            extra = n - 7 - hit_len
+            if extra < 0 or extra > 2 + 3*_MAX_HIT_PARAMETRICS:
+                return "hit length does not match the event data set"
+            if channels and body[6] not in channels:
+                return "hit on unknown channel %d" % body[6]
+        elif MID in (2, 3):
+            blocks, rest = divmod(n - 6 - 3*n_pid, 1 + fv_len)
+            if blocks < 0:
+                return "time-driven message too short"
+            if rest:
+                return "time-driven length does not match the demand set"
+            if channels and blocks > len(channels):
+                return "time-driven message has more channels than the setup"
+        elif MID == 173:
+            if n < 9 or (n - 9) % 2:
+                return "waveform length is not a whole number of samples"
+            if channels and body[7] not in channels:
+                return "waveform on unknown channel %d" % body[7]
+        elif MID in (128, 129, 130):
+            if n not in (6, 7):
+                return "control message length"
+        elif MID == 11:
+            if n != 0:
+                return "reset message length"
+        elif n == 0 and MID != 8:
+            return "empty message"
+        return None
+
+    return check
+
+
+class _ByteLRU:
+    """Least recently used mapping bounded by the total size of its values.
+
+    The most recent entry is always kept, even if it alone is larger than
+    ``max_bytes``.  Callers hold their own lock.
+    """
 
-    # Parametric PID order (captured from first hit that has parametrics)
-    param_pids = None
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Value for key, marked as most recently used, or None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value, nbytes):
+        """Insert value, which takes nbytes, and evict the oldest entries"""
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.nbytes -= old[1]
+        self._entries[key] = (value, nbytes)
+        self.nbytes += nbytes
+        while self.nbytes > self.max_bytes and len(self._entries) > 1:
+            _, (_, n) = self._entries.popitem(last=False)
+            self.nbytes -= n
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+
+class _PrefetchReader:
+    """Read-only view of an open binary file that reads ahead.
+
+    A background thread reads blocks of ``block_size`` bytes, aligned to
+    multiples of the block size, and keeps up to ``queue_depth`` of them
+    queued while the caller parses the current one.  Reads spanning block
+    boundaries are joined.  Seeking outside the current block restarts the
+    read-ahead at the new position.  The wrapped file must not be used
+    directly until :meth:`close` is called.
+    """
 
-    # Time-driven column order (captured from first TD record)
-    td_pid_order = None
-    td_cid_order = None
-    td_fv_keys = None
+    def __init__(self, raw, block_size=1 << 20, queue_depth=4):
+        self._raw = raw
+        self.block_size = block_size
+        self.queue_depth = queue_depth
+        self._thread = None
+        self._start(raw.tell())
+
+    def _start(self, pos):
+        start = pos - pos % self.block_size
+        self._block = b''
+        self._block_pos = start     # file offset of self._block
+        self._offset = pos - start  # read position within self._block
+        self._eof = False
+        self._stop = threading.Event()
+        self._queue = queue.Queue(self.queue_depth)
+        self._thread = threading.Thread(
+            target=self._fill, args=(start, self._queue, self._stop),
+            daemon=True)
+        self._thread.start()
+
+    def _fill(self, pos, blocks, stop):
+        def put(item):
+            while not stop.is_set():
+                try:
+                    blocks.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        try:
+            self._raw.seek(pos)
+            while True:
+                block = self._raw.read(self.block_size)
+                if not put(block) or not block:
+                    return
+        except Exception as e:
+            put(e)
+
+    def _halt(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _next_block(self):
+        block = self._queue.get()
+        if isinstance(block, Exception):
+            raise block
+        return block
+
+    def read(self, n=-1):
+        end = self._offset + n
+        if 0 <= n and end <= len(self._block):
+            self._offset = end
+            return self._block[end-n:end]
+
+        out = []
+        while n != 0 and not self._eof:
+            if self._offset >= len(self._block):
+                self._block_pos += len(self._block)
+                self._offset -= len(self._block)
+                self._block = self._next_block()
+                self._eof = not self._block
+                continue
+            stop = None if n < 0 else self._offset + n
+            chunk = self._block[self._offset:stop]
+            self._offset += len(chunk)
+            out.append(chunk)
+            if n > 0:
+                n -= len(chunk)
+        return b''.join(out)
+
+    def tell(self):
+        return self._block_pos + self._offset
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            pos += self.tell()
+        elif whence == io.SEEK_END:
+            pos += os.fstat(self.fileno()).st_size
+        if 0 <= pos - self._block_pos < len(self._block):
+            self._offset = pos - self._block_pos
+        else:
+            self._halt()
+            self._start(pos)
+        return pos
 
-    for file in files:
-      with open(file, "rb") as data:
-        if config is None:
-            config = _read_config(data)
+    def fileno(self):
+        return self._raw.fileno()
 
-        CHID_list = config["chid_list"]
-        gain = config["gain"]
-        hardware_cfg = config["hardware_cfg"]
-        partial_power_segments = config["partial_power_segments"]
-        demand_chid_list = config["demand_chid_list"]
-        demand_pid_list = config["demand_pid_list"]
+    def close(self):
+        """Stop reading ahead; the wrapped file stays open"""
+        self._halt()
 
-        byte = data.read(2)
-        while byte != b"":
+    def __enter__(self):
+        return self
 
-            # Get the message length byte
-            [LEN] = struct.unpack('H', byte)
+    def __exit__(self, *exc):
+        self.close()
 
-            # Read the message ID byte
-            [b1] = struct.unpack('B', data.read(1))
-            LEN = LEN-1
 
-            # ID 40-49 have an extra byte
-            if b1 >= 40 and b1 <= 49:
-                [b2] = struct.unpack('B', data.read(1))
-                LEN = LEN-1
+def _iter_frames(data, check=None, report=None, file=None):
+    """Generator over the messages of an open .DTA file.
 
-            if b1 == 1:
-                logging.info("AE Hit or Event Data")
+    Yields ``(offset, MID, body)`` for each message, starting from the
+    current file position, where body holds the bytes following the MID
+    byte.  MID 8 (continued file) only spans its 8-byte time field: the
+    setup record it wraps is yielded message by message.
 
-                RTOT = _bytes_to_RTOT(data.read(6))
-                LEN = LEN-6
+    If ``check`` (see :func:`_frame_checker`) is given, messages that fail
+    it are not yielded; the parser skips ahead to the next position where
+    a chain of plausible messages starts (see :func:`_find_frame`) and
+    appends a :class:`SkippedRange` to ``report``.  A message running past
+    the end of the file is reported as truncated.
+    """
+    pos = data.tell()
+    size = os.fstat(data.fileno()).st_size if check else None
 
-                [CID] = struct.unpack('B', data.read(1))
-                LEN = LEN-1
+    # MIDs of accepted messages, used to rule out resync candidates
+    seen = set()
 
-                record = [RTOT, CID]
+    # Inside the setup record of a continued file
+    in_setup = False
 
-                # Look up byte length and read data values
-                for CHID in CHID_list:
-                    b = CHID_byte_len[CHID]
+    while True:
+        header = data.read(3)
+        if len(header) < 3:
+            if header and check:
+                report.append(SkippedRange(
+                    file, pos, pos + len(header), "truncated message"))
+            return
+
+        [LEN, MID] = struct.unpack('<HB', header)
+        body = data.read(8 if MID == 8 else max(LEN - 1, 0))
+
+        if check:
+            reason = None
+            if pos + 2 + LEN > size:
+                reason = "truncated message"
+            else:
+                reason = check(MID, body, in_setup)
+
+            if reason:
+                nxt = _find_frame(data, pos + 1, size, check, seen)
+                report.append(SkippedRange(
+                    file, pos, size if nxt is None else nxt, reason))
+                if nxt is None:
+                    return
+                pos = nxt
+                data.seek(pos)
+                continue
 
-                    if CHID_to_str[CHID] == 'PARTIAL POWER':
-                        v = data.read(partial_power_segments)
-                        LEN = LEN - partial_power_segments
-                        record.append(v)
-                        continue
+        if check:
+            seen.add(MID)
+            if MID == 8:
+                in_setup = True
+            elif MID == 11:
+                in_setup = False
+        yield pos, MID, body
+        pos += 3 + len(body)
 
-                    if CHID_to_str[CHID] == 'RMS':
-                        [v] = struct.unpack('H', data.read(b))
-                        v = v/5000
 
-                    # DURATION
-                    elif CHID_to_str[CHID] == 'DURATION':
-                        [v] = struct.unpack('i', data.read(b))
+def _find_frame(data, pos, size, check, seen):
+    """Return the offset of the next plausible message at or after pos.
 
-                    # SIG STRENGTH
-                    elif CHID_to_str[CHID] == 'SIG STRENGTH':
-                        [v] = struct.unpack('i', data.read(b))
-                        v = v*3.05
+    A candidate must be a hit, time-driven or waveform message that passes
+    ``check`` and starts a chain of ``_RESYNC_CHAIN`` plausible messages
+    (or a shorter chain ending exactly at the end of the file), each with a
+    MID already seen in ``seen`` when that set is not empty.
+    """
+    def peek(offset, n):
+        data.seek(offset)
+        return data.read(n)
+
+    def plausible(offset, strict):
+        header = peek(offset, 3)
+        if len(header) < 3:
+            return None
+        [LEN, MID] = struct.unpack('<HB', header)
+        if LEN == 0 or offset + 2 + LEN > size:
+            return None
+        if strict and MID not in (1, 2, 3, 173):
+            return None
+        if seen and MID not in seen:
+            return None
+        n = 8 if MID == 8 else LEN - 1
+        if check(MID, peek(offset + 3, n)) is not None:
+            return None
+        return offset + 3 + n
+
+    while pos < size - 2:
+        window = peek(pos, _RESYNC_WINDOW)
+        for i in range(len(window) - 2):
+            [LEN, MID] = struct.unpack_from('<HB', window, i)
+            if MID not in (1, 2, 3, 173) or pos + i + 2 + LEN > size:
+                continue
+            nxt = plausible(pos + i, True)
+            for _ in range(_RESYNC_CHAIN - 1):
+                if nxt is None or nxt == size:
+                    break
+                nxt = plausible(nxt, False)
+            if nxt is not None:
+                return pos + i
+        pos += max(len(window) - 2, 1)
+    return None
+
+
+def _decode_message(b1, body, config, skip_wfm=False, include_td=True):
+    """Decode one data or control message for :func:`iter_bin`.
 
-                    # ABS-ENERGY
-                    elif CHID_to_str[CHID] == 'ABS-ENERGY':
-                        [v] = struct.unpack('f', data.read(b))
-                        v = v*9.31e-4
+    Args:
+        b1 (int): message ID
+        body (bytes): message bytes following the ID
+        config (dict): setup state; the column orders (``param_pids``,
+            ``td_pid_order``, ``td_cid_order``, ``td_fv_keys``) are added
+            from the first messages that define them
+        skip_wfm (bool): do not decode waveforms if True
+        include_td (bool): decode time-driven data if True
+    Returns:
+        ``(EventType, record)`` as yielded by :func:`iter_bin`, or None
+    """
+    CHID_list = config["chid_list"]
+    gain = config["gain"]
+    hardware_cfg = config["hardware_cfg"]
+    partial_power_segments = config["partial_power_segments"]
+    demand_chid_list = config["demand_chid_list"]
+    demand_pid_list = config["demand_pid_list"]
 
-                    elif b == 1:
-                        [v] = struct.unpack('B', data.read(b))
+    msg = io.BytesIO(body)
+    LEN = len(body)
 
-                    elif b == 2:
-                        [v] = struct.unpack('H', data.read(b))
+    # ID 40-49 have an extra byte
+    if b1 >= 40 and b1 <= 49:
+        [b2] = struct.unpack('B', msg.read(1))
+        LEN = LEN-1
 
-                    LEN = LEN-b
-                    record.append(v)
+    if b1 == 1:
+        logging.info("AE Hit or Event Data")
 
-                # Parametric channels: PID(u8) + VALUE(u16) repeats
-                # Trailing 2 bytes are undocumented (observed: varies)
-                parametrics = {}
-                while LEN >= 5:  # PID(1) + VALUE(2) + trailing(2)
-                    [pid] = struct.unpack('B', data.read(1))
-                    [val] = struct.unpack('H', data.read(2))
-                    LEN = LEN - 3
-                    parametrics[pid] = val
-                data.read(LEN)  # trailing bytes
+        RTOT = _bytes_to_RTOT(msg.read(6))
+        LEN = LEN-6
 
-                if parametrics and param_pids is None:
-                    param_pids = tuple(parametrics.keys())
-                    config["param_pids"] = param_pids
+        [CID] = struct.unpack('B', msg.read(1))
+        LEN = LEN-1
 
-                for pid in (param_pids or ()):
-                    record.append(parametrics.get(pid))
+        record = [RTOT, CID]
 
-                yield (EventType.HIT, record)
+        # Look up byte length and read data values
+        for CHID in CHID_list:
+            b = CHID_byte_len[CHID]
 
-            elif b1 in (2, 3):
-                logging.info("Time-Driven Data" if b1 == 2
-                             else "User-Forced Sample Data")
+            if CHID_to_str[CHID] == 'PARTIAL POWER':
+                v = msg.read(partial_power_segments)
+                LEN = LEN - partial_power_segments
+                record.append(v)
+                continue
 
-                if not include_td:
-                    data.read(LEN)
-                    byte = data.read(2)
-                    continue
+            if CHID_to_str[CHID] == 'RMS':
+                [v] = struct.unpack('H', msg.read(b))
+                v = v/5000
 
-                RTOT = _bytes_to_RTOT(data.read(6))
-                LEN = LEN-6
-
-                # Parametric channels: PID(u8) + VALUE(u16) per demand PID
-                parametrics = {}
-                for _ in demand_pid_list:
-                    if LEN < 3:
-                        break
-                    [pid] = struct.unpack('B', data.read(1))
-                    [val] = struct.unpack('H', data.read(2))
-                    LEN = LEN - 3
-                    parametrics[pid] = val
-
-                # Feature vector length from demand CHID list
-                fv_len = 0
-                for chid in demand_chid_list:
-                    if chid == 22:
-                        fv_len += partial_power_segments
-                    else:
-                        fv_len += CHID_byte_len.get(chid, 0)
-
-                # Channel blocks: CID(u8) + FV(fv_len) repeats
-                per_channel = {}
-                while LEN >= 1 + fv_len and fv_len > 0:
-                    [cid] = struct.unpack('B', data.read(1))
-                    fv = data.read(fv_len)
-                    LEN = LEN - 1 - fv_len
-                    per_channel[cid] = _decode_td_fv(
-                        fv, demand_chid_list, partial_power_segments)
-
-                data.read(LEN)  # trailing bytes
-
-                # Capture column order from first record
-                if td_pid_order is None:
-                    td_pid_order = tuple(parametrics.keys())
-                    config["td_pid_order"] = td_pid_order
-                if td_cid_order is None:
-                    td_cid_order = tuple(sorted(per_channel.keys()))
-                    config["td_cid_order"] = td_cid_order
-                if td_fv_keys is None and per_channel:
-                    first_cid = next(iter(per_channel))
-                    td_fv_keys = tuple(
-                        per_channel[first_cid].keys())
-                    config["td_fv_keys"] = td_fv_keys
-
-                pid_vals = [parametrics.get(p) for p in
-                            (td_pid_order or ())]
-                cid_vals = []
-                for cid in (td_cid_order or ()):
-                    fv_dict = per_channel.get(cid, {})
-                    for key in (td_fv_keys or ()):
-                        cid_vals.append(fv_dict.get(key))
-
-                yield (EventType.TIME_DRIVEN, [RTOT] + pid_vals + cid_vals)
-
-            elif b1 == 8:
-                logging.info("Message for Continued File")
-
-                # Time of continuation
-                data.read(8)
-
-                # The rest of the mssage contains a setup record,
-                # reset LEN and process as a new message
-                LEN = 0
-
-            elif b1 == 128:
-                RTOT = _bytes_to_RTOT(data.read(6))
-                LEN = LEN - 6
-                logging.info(
-                    "{0:.7f} Resume Test or Start Of Test".format(RTOT))
-                data.read(LEN)  # trailing status byte(s)
-
-            elif b1 == 129:
-                RTOT = _bytes_to_RTOT(data.read(6))
-                LEN = LEN - 6
-                logging.info("{0:.7f} Stop the test".format(RTOT))
-                data.read(LEN)
+            # RMS8
+            elif CHID_to_str[CHID] == 'RMS8':
+                [v] = struct.unpack('B', msg.read(b))
+                v = v/20
 
-            elif b1 == 130:
-                RTOT = _bytes_to_RTOT(data.read(6))
-                LEN = LEN - 6
-                logging.info("{0:.7f} Pause the test".format(RTOT))
-                data.read(LEN)
+            # DURATION
+            elif CHID_to_str[CHID] == 'DURATION':
+                [v] = struct.unpack('i', msg.read(b))
 
-            elif b1 == 173:
-                logging.info("Digital AE Waveform Data")
-                if skip_wfm:
-                    data.read(LEN)
-                    byte = data.read(2)
-                    continue
+            # SIG STRENGTH
+            elif CHID_to_str[CHID] == 'SIG STRENGTH':
+                [v] = struct.unpack('i', msg.read(b))
+                v = v*3.05
 
-                [SUBID] = struct.unpack('B', data.read(1))
-                LEN = LEN-1
+            # ABS-ENERGY
+            elif CHID_to_str[CHID] == 'ABS-ENERGY':
+                [v] = struct.unpack('f', msg.read(b))
+                v = v*9.31e-4
 
-                TOT = _bytes_to_RTOT(data.read(6))
-                LEN = LEN-6
+            elif b == 1:
+                [v] = struct.unpack('B', msg.read(b))
 
-                [CID] = struct.unpack('B', data.read(1))
-                LEN = LEN-1
+            elif b == 2:
+                [v] = struct.unpack('H', msg.read(b))
 
-                # ALB
-                data.read(1)
-                LEN = LEN-1
+            elif b == 4:
+                [v] = struct.unpack('I', msg.read(b))
+
+            LEN = LEN-b
+            record.append(v)
 
-                MaxInput = 10.0
-                Gain = 10**(gain[CID]/20)
-                MaxCounts = 32768.0
-                AmpScaleFactor = MaxInput/(Gain*MaxCounts)
+        # Parametric channels: PID(u8) + VALUE(u16) repeats
+        # Trailing 2 bytes are undocumented (observed: varies)
+        parametrics = {}
+        while LEN >= 5:  # PID(1) + VALUE(2) + trailing(2)
+            [pid] = struct.unpack('B', msg.read(1))
+            [val] = struct.unpack('H', msg.read(2))
+            LEN = LEN - 3
+            parametrics[pid] = val
 
-                s = struct.unpack(str(int(LEN/2))+'h', data.read(LEN))
+        if parametrics and "param_pids" not in config:
+            config["param_pids"] = tuple(parametrics.keys())
 
-                # Append waveform to wfm with data stored as a byte string
-                hw = hardware_cfg[CID]
-                yield (EventType.WAVEFORM, [TOT, CID, hw['SRATE'], hw['TDLY'],
-                                    AmpScaleFactor*np.array(s)])
+        for pid in config.get("param_pids", ()):
+            record.append(parametrics.get(pid))
 
+        return (EventType.HIT, record)
+
+    elif b1 in (2, 3):
+        logging.info("Time-Driven Data" if b1 == 2
+                     else "User-Forced Sample Data")
+
+        if not include_td:
+            return None
+
+        RTOT = _bytes_to_RTOT(msg.read(6))
+        LEN = LEN-6
+
+        # Parametric channels: PID(u8) + VALUE(u16) per demand PID
+        parametrics = {}
+        for _ in demand_pid_list:
+            if LEN < 3:
+                break
+            [pid] = struct.unpack('B', msg.read(1))
+            [val] = struct.unpack('H', msg.read(2))
+            LEN = LEN - 3
+            parametrics[pid] = val
+
+        # Feature vector length from demand CHID list
+        fv_len = 0
+        for chid in demand_chid_list:
+            if chid == 22:
+                fv_len += partial_power_segments
             else:
-                logging.debug("ID "+str(b1)+" not yet implemented!")
-                data.read(LEN)
+                fv_len += CHID_byte_len.get(chid, 0)
+
+        # Channel blocks: CID(u8) + FV(fv_len) repeats
+        per_channel = {}
+        while LEN >= 1 + fv_len and fv_len > 0:
+            [cid] = struct.unpack('B', msg.read(1))
+            fv = msg.read(fv_len)
+            LEN = LEN - 1 - fv_len
+            per_channel[cid] = _decode_td_fv(
+                fv, demand_chid_list, partial_power_segments)
+
+        # Capture column order from first record
+        if "td_pid_order" not in config:
+            config["td_pid_order"] = tuple(parametrics.keys())
+        if "td_cid_order" not in config:
+            config["td_cid_order"] = tuple(sorted(per_channel.keys()))
+        if "td_fv_keys" not in config and per_channel:
+            first_cid = next(iter(per_channel))
+            config["td_fv_keys"] = tuple(per_channel[first_cid].keys())
+
+        pid_vals = [parametrics.get(p) for p in
+                    config["td_pid_order"]]
+        cid_vals = []
+        for cid in config["td_cid_order"]:
+            fv_dict = per_channel.get(cid, {})
+            for key in config.get("td_fv_keys", ()):
+                cid_vals.append(fv_dict.get(key))
+
+        return (EventType.TIME_DRIVEN, [RTOT] + pid_vals + cid_vals)
+
+    elif b1 == 8:
+        # Time of continuation; the setup record that follows is
+        # processed message by message
+        logging.info("Message for Continued File")
+
+    elif b1 == 128:
+        RTOT = _bytes_to_RTOT(msg.read(6))
+        logging.info(
+            "{0:.7f} Resume Test or Start Of Test".format(RTOT))
+
+    elif b1 == 129:
+        RTOT = _bytes_to_RTOT(msg.read(6))
+        logging.info("{0:.7f} Stop the test".format(RTOT))
+
+    elif b1 == 130:
+        RTOT = _bytes_to_RTOT(msg.read(6))
+        logging.info("{0:.7f} Pause the test".format(RTOT))
+
+    elif b1 == 173:
+        logging.info("Digital AE Waveform Data")
+        if skip_wfm:
+            return None
+
+        [SUBID] = struct.unpack('B', msg.read(1))
+        LEN = LEN-1
+
+        TOT = _bytes_to_RTOT(msg.read(6))
+        LEN = LEN-6
+
+        [CID] = struct.unpack('B', msg.read(1))
+        LEN = LEN-1
+
+        # ALB
+        msg.read(1)
+        LEN = LEN-1
+
+        AmpScaleFactor = _amp_scale_factor(gain[CID])
+
+        s = struct.unpack(str(int(LEN/2))+'h', msg.read(LEN))
+
+        # Only waveforms need numpy
+        import numpy as np
+
+        # Append waveform to wfm with data stored as a byte string
+        hw = hardware_cfg[CID]
+        return (EventType.WAVEFORM, [TOT, CID, hw['SRATE'], hw['TDLY'],
+                                     AmpScaleFactor*np.array(s)])
 
-            byte = data.read(2)
+    else:
+        logging.debug("ID "+str(b1)+" not yet implemented!")
+
+    return None
+
+
+def iter_bin(files, skip_wfm=False, include_td=True, config=None,
+             resync=False, report=None, prefetch=0, queue_depth=4):
+    """Generator that streams parsed events from one or more .DTA files.
+
+    Yields ``(type, data)`` tuples as events are encountered in the byte
+    stream, keeping memory usage constant regardless of file size.  The
+    header / setup portion of the first file is consumed internally by
+    :func:`_read_config`; only data events are yielded.
+
+    Args:
+        files (str or list): path to a .DTA file, or list of paths for
+            continuation files (state is shared across files)
+        skip_wfm (bool): do not yield waveform events if True
+        include_td (bool): yield time-driven events if True
+        config (dict): optional dict that is filled in place with the setup
+            state of the first file, plus the column orders (``param_pids``,
+            ``td_pid_order``, ``td_cid_order``, ``td_fv_keys``) as they are
+            discovered in the stream
+        resync (bool): if True, validate each message against the lengths
+            expected from the setup, skip corrupt or undecodable regions
+            and resume at the next plausible message instead of raising or
+            decoding garbage; a truncated last message ends the file
+        report (list): in resync mode, a :class:`SkippedRange` is appended
+            for every byte range that was skipped
+        prefetch (int): if nonzero, read each file in aligned blocks of
+            this many bytes in a background thread while the current block
+            is parsed, which hides the latency of network storage; 1 MiB
+            or more is a reasonable size
+        queue_depth (int): number of blocks read ahead when prefetching
+
+    Yields:
+        ``(EventType.HIT, record)`` — flat list matching a row of the rec
+            recarray: ``[RTOT, CID, *CHID_values, *PARAM_values]``
+
+        ``(EventType.TIME_DRIVEN, record)`` — flat list matching a row of
+            the td recarray: ``[RTOT, *PID_values, *CID_FV_values]``
+
+        ``(EventType.WAVEFORM, record)`` — flat list:
+            ``[RTOT, CID, SRATE, TDLY, numpy.ndarray]``
+    """
+    if isinstance(files, str):
+        files = [files]
+
+    if config is None:
+        config = {}
+
+    if report is None:
+        report = []
+
+    # Column orders are captured from the first hit with parametrics and
+    # the first time-driven record
+    for key in ("param_pids", "td_pid_order", "td_cid_order", "td_fv_keys"):
+        config.pop(key, None)
+
+    for file in files:
+        with open(file, "rb") as raw, \
+                (_PrefetchReader(raw, prefetch, queue_depth) if prefetch
+                 else contextlib.nullcontext(raw)) as data:
+            if "chid_list" not in config:
+                config.update(_read_config(data))
+
+            check = _frame_checker(config) if resync else None
+            frames = _iter_frames(data, check=check, report=report,
+                                  file=file)
+
+            for start, b1, body in frames:
+                try:
+                    event = _decode_message(b1, body, config, skip_wfm,
+                                            include_td)
+                except (struct.error, KeyError, IndexError, ValueError) as e:
+                    if not resync:
+                        raise
+                    report.append(SkippedRange(
+                        file, start, start + 3 + len(body),
+                        "undecodable message: %r" % e))
+                    continue
+
+                if event is not None:
+                    yield event
 
 
 def _read_config(data):
@@ -461,7 +874,7 @@ def _read_config(data):
                 # SUBID
                 while LEN > 0:
                     [LSUB] = struct.unpack('H', data.read(2))
-                    LEN = LEN-LSUB
+                    LEN = LEN-2-LSUB
 
                     [SUBID] = struct.unpack('B', data.read(1))
                     LSUB = LSUB-1
@@ -643,7 +1056,73 @@ def _read_config(data):
     }
 
 
-def read_bin(files, skip_wfm=False, include_td=False, include_config=False):
+_WFM_NAMES = [TIME, 'CH', 'SRATE', 'TDLY', 'WAVEFORM']
+
+
+def _rec_names(config):
+    """Column names of the rec table for a config filled by iter_bin"""
+    return ([TIME, 'CH']
+            + [CHID_to_str[i] for i in config["chid_list"]]
+            + ['PARAM_%d' % p for p in config.get("param_pids", ())])
+
+
+def _td_names(config):
+    """Column names of the td table for a config filled by iter_bin"""
+    pid_cols = ['PID_%d' % p for p in config.get("td_pid_order", ())]
+    cid_cols = []
+    for cid in config.get("td_cid_order", ()):
+        for key in config.get("td_fv_keys", ()):
+            cid_cols.append('CID%d_%s' % (cid, key))
+    return [TIME] + pid_cols + cid_cols
+
+
+def _fromrecords(rows, names, partial_power_segments):
+    """Build a recarray from iter_bin records as plain old data.
+
+    PARTIAL POWER values become a uint8 subarray field with one entry per
+    segment (``table['PARTIAL POWER'][:, k]`` is a view of segment k), and
+    columns with missing values (None) become float columns holding NaN.
+    """
+    import numpy as np
+
+    segments = {}
+    empty = bytes(partial_power_segments)
+    for i, name in enumerate(names):
+        if name.endswith('PARTIAL POWER'):
+            values = b''.join([(r[i] or empty).ljust(partial_power_segments,
+                                                     b'\x00')
+                               for r in rows])
+            segments[name] = np.frombuffer(values, np.uint8).reshape(
+                len(rows), partial_power_segments)
+            for r in rows:
+                r[i] = 0
+
+    table = np.rec.fromrecords(rows, names=names)
+    if not segments and object not in [table.dtype[n] for n in names]:
+        return table
+
+    dtype = []
+    for name in names:
+        if name in segments:
+            dtype.append((name, np.uint8, (partial_power_segments,)))
+        elif table.dtype[name] == object:
+            dtype.append((name, float))
+        else:
+            dtype.append((name, table.dtype[name]))
+
+    out = np.recarray(len(rows), dtype=dtype)
+    for name in names:
+        if name in segments:
+            out[name] = segments[name]
+        elif table.dtype[name] == object:
+            out[name] = [np.nan if v is None else v for v in table[name]]
+        else:
+            out[name] = table[name]
+    return out
+
+
+def read_bin(files, skip_wfm=False, include_td=False, include_config=False,
+             resync=False, report=None, prefetch=0, queue_depth=4):
     """Read binary AEWin data files, returning recarrays.
 
     Thin wrapper around :func:`iter_bin` that collects streamed events
@@ -655,12 +1134,21 @@ def read_bin(files, skip_wfm=False, include_td=False, include_config=False):
         skip_wfm (bool): do not return waveforms if True
         include_td (bool): if True, return a td recarray of time-driven data
         include_config (bool): if True, return a config dict as last element
+        resync (bool): skip corrupt or truncated regions, see
+            :func:`iter_bin`
+        report (list): receives a :class:`SkippedRange` per skipped region
+        prefetch (int): read ahead in blocks of this many bytes in a
+            background thread, see :func:`iter_bin`
+        queue_depth (int): number of blocks read ahead when prefetching
     Returns:
         rec (numpy.recarray): table of acoustic hits
         wfm (numpy.recarray): table containing any saved waveforms
         td (numpy.recarray): time-driven data (only when include_td=True)
         config (dict): hardware configuration (only when include_config=True)
     """
+    import numpy as np
+    from numpy.lib.recfunctions import append_fields
+
     if isinstance(files, str):
         files = [files]
 
@@ -668,15 +1156,21 @@ def read_bin(files, skip_wfm=False, include_td=False, include_config=False):
     with open(files[0], "rb") as f:
         config = _read_config(f)
 
-    CHID_list = config["chid_list"]
     test_start_time = config["test_start_time"]
 
     rec = []
     wfm = []
     td = []
 
+    # Column orders are only known once the stream has been read
+    stream_config = {}
+
     for ev_type, ev_data in iter_bin(files, skip_wfm=skip_wfm,
-                                     include_td=include_td):
+                                     include_td=include_td,
+                                     config=stream_config,
+                                     resync=resync, report=report,
+                                     prefetch=prefetch,
+                                     queue_depth=queue_depth):
         if ev_type is EventType.HIT:
             rec.append(ev_data)
 
@@ -700,36 +1194,22 @@ def read_bin(files, skip_wfm=False, include_td=False, include_config=False):
     # Convert numpy array and add record names
     # fromrecords() fails on an empty list
     if rec:
-        param_pids = config.get("param_pids", ())
-        param_names = ['PARAM_%d' % p for p in param_pids]
-        rec = np.rec.fromrecords(
-            rec,
-            names=['SSSSSSSS.mmmuuun', 'CH']
-            + [CHID_to_str[i] for i in CHID_list]
-            + param_names)
+        rec = _fromrecords(rec, _rec_names(stream_config),
+                           stream_config["partial_power_segments"])
 
         # Append a Unix timestamp field
         timestamp = [
             (test_start_time + timedelta(seconds=t)).timestamp()
-            for t in rec['SSSSSSSS.mmmuuun']]
+            for t in rec[TIME]]
         rec = append_fields(rec, 'TIMESTAMP', timestamp,
                             usemask=False, asrecarray=True)
 
     if wfm:
-        wfm = np.rec.fromrecords(
-            wfm, names=['SSSSSSSS.mmmuuun', 'CH', 'SRATE', 'TDLY', 'WAVEFORM'])
+        wfm = np.rec.fromrecords(wfm, names=_WFM_NAMES)
 
     if include_td and td:
-        td_pid_order = config.get("td_pid_order", ())
-        td_cid_order = config.get("td_cid_order", ())
-        td_fv_keys = config.get("td_fv_keys", ())
-        pid_cols = ['PID_%d' % p for p in td_pid_order]
-        cid_cols = []
-        for cid in td_cid_order:
-            for key in td_fv_keys:
-                cid_cols.append('CID%d_%s' % (cid, key))
-        td = np.rec.fromrecords(
-            td, names=['SSSSSSSS.mmmuuun'] + pid_cols + cid_cols)
+        td = _fromrecords(td, _td_names(stream_config),
+                          stream_config["partial_power_segments"])
 
     result = (rec, wfm)
     if include_td:
@@ -741,8 +1221,91 @@ def read_bin(files, skip_wfm=False, include_td=False, include_config=False):
     return result
 
 
+def iter_chunks(files, chunk_size=65536, skip_wfm=False, include_td=False,
+                resync=False, report=None, prefetch=0, queue_depth=4,
+                max_delay=None, read_times=None):
+    """Generator that streams events from :func:`iter_bin` as recarray chunks.
+
+    Each chunk holds up to ``chunk_size`` consecutive events of one type and
+    uses the same column names as the tables returned by :func:`read_bin`
+    (without the TIMESTAMP field), so column-wise numpy code written for
+    ``read_bin`` output can run on each chunk while memory stays bounded.
+
+    Args:
+        files (str or list): path to a .DTA file, or list of paths for
+            continuation files (state is shared across files)
+        chunk_size (int): maximum number of rows per chunk
+        skip_wfm (bool): do not yield waveform chunks if True
+        include_td (bool): yield time-driven chunks if True
+        resync (bool): skip corrupt or truncated regions, see
+            :func:`iter_bin`
+        report (list): receives a :class:`SkippedRange` per skipped region
+        prefetch (int): read ahead in blocks of this many bytes in a
+            background thread, see :func:`iter_bin`
+        queue_depth (int): number of blocks read ahead when prefetching
+        max_delay (float): if not None, also yield a chunk once its oldest
+            event was read this many seconds ago; checked as events arrive,
+            so a slow type of event does not wait for ``chunk_size`` rows
+        read_times (list): receives, for each yielded chunk, the
+            ``time.perf_counter()`` when its oldest event was read
+
+    Yields:
+        ``(EventType, recarray)`` — a chunk of rec, wfm or td rows. Chunks
+            of different types are interleaved in the order they fill up.
+    """
+    import numpy as np
+
+    config = {}
+    buffers = {EventType.HIT: [],
+               EventType.TIME_DRIVEN: [],
+               EventType.WAVEFORM: []}
+
+    # perf_counter() when the oldest event of each buffer was read
+    first_read = {}
+    timed = max_delay is not None or read_times is not None
+
+    def flush(ev_type):
+        rows = buffers[ev_type]
+        buffers[ev_type] = []
+        if read_times is not None:
+            read_times.append(first_read[ev_type])
+        if ev_type is EventType.HIT:
+            names = _rec_names(config)
+        elif ev_type is EventType.TIME_DRIVEN:
+            names = _td_names(config)
+        else:
+            return (ev_type, np.rec.fromrecords(rows, names=_WFM_NAMES))
+        return (ev_type, _fromrecords(rows, names,
+                                      config["partial_power_segments"]))
+
+    for ev_type, ev_data in iter_bin(files, skip_wfm=skip_wfm,
+                                     include_td=include_td, config=config,
+                                     resync=resync, report=report,
+                                     prefetch=prefetch,
+                                     queue_depth=queue_depth):
+        now = time.perf_counter() if timed else None
+        if ev_type is EventType.WAVEFORM:
+            ev_data[4] = ev_data[4].tobytes()
+        if not buffers[ev_type]:
+            first_read[ev_type] = now
+        buffers[ev_type].append(ev_data)
+        if len(buffers[ev_type]) >= chunk_size:
+            yield flush(ev_type)
+
+        if max_delay is not None:
+            for t in buffers:
+                if buffers[t] and now - first_read[t] >= max_delay:
+                    yield flush(t)
+
+    for ev_type in buffers:
+        if buffers[ev_type]:
+            yield flush(ev_type)
+
+
 def get_waveform_data(wfm_row):
     """Returns time and voltage from a row of the wfm recarray"""
+    import numpy as np
+
     V = np.frombuffer(wfm_row['WAVEFORM'])
     t = 1e6*(np.arange(0, len(V))+wfm_row['TDLY'])/wfm_row['SRATE']
     return t, V
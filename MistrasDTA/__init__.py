@@ -1 +1,15 @@
-from .MistrasDTA import read_bin, iter_bin, get_waveform_data, EventType
+from .MistrasDTA import (read_bin, iter_bin, iter_chunks, get_waveform_data,
+                         EventType, SkippedRange)
+from .write import write_bin, subset_dta
+
+# Submodules that import numpy at load time are only imported on first use
+_LAZY_SUBMODULES = ('aggregate', 'alarm', 'analysis', 'serve', 'shared',
+                    'waveforms')
+
+
+def __getattr__(name):
+    if name in _LAZY_SUBMODULES:
+        import importlib
+        return importlib.import_module('.' + name, __name__)
+    raise AttributeError(
+        "module {!r} has no attribute {!r}".format(__name__, name))
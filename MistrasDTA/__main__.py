@@ -0,0 +1,26 @@
+import argparse
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='mistrasdta', description='Tools for AEWin .DTA files')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve = commands.add_parser(
+        'serve', help='answer hit, TD and waveform queries over HTTP')
+    serve.add_argument('root', help='directory holding the .DTA files')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8765)
+    serve.add_argument('--cache-mb', type=int, default=1024,
+                       help='memory bound of the decoded-file cache')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        from .serve import serve as run
+        run(args.root, host=args.host, port=args.port,
+            max_bytes=args.cache_mb << 20)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+import numpy as np
+
+from .MistrasDTA import TIME, EventType, _td_cids, iter_chunks
+
+
+REDUCTIONS = ('count', 'sum', 'min', 'max', 'mean', 'hist')
+
+# Default histogram bin edges: 1 dB bins over the AMP range
+AMP_BINS = np.arange(0, 101)
+
+
+class Aggregator:
+    """Per-channel, per-time-bucket reductions computed chunk by chunk.
+
+    State is kept per ``(CH, bucket)`` group, so memory scales with the
+    number of buckets rather than the number of events.  Aggregators over
+    different files or workers can be combined with :meth:`merge` as long
+    as they share the same specs, bucket width and bins.
+
+    Args:
+        specs (list): ``(column, reduction)`` tuples, where reduction is one
+            of ``count``, ``sum``, ``min``, ``max``, ``mean`` or ``hist``.
+            The column of a ``count`` spec may be None.  For time-driven
+            data, columns are feature names such as ``'RMS'`` and are
+            grouped by the CID they were sampled on.
+        bucket (float): bucket width in seconds of RTOT
+        event_type (EventType): aggregate HIT or TIME_DRIVEN chunks
+        bins (array_like): histogram bin edges used by ``hist`` specs
+    """
+
+    def __init__(self, specs, bucket=1.0, event_type=EventType.HIT,
+                 bins=AMP_BINS):
+        self.specs = []
+        for column, reduction in specs:
+            if reduction not in REDUCTIONS:
+                raise ValueError("Unknown reduction: " + str(reduction))
+            if column is None and reduction != 'count':
+                raise ValueError(reduction + " requires a column")
+            self.specs.append((column, reduction))
+
+        if event_type not in (EventType.HIT, EventType.TIME_DRIVEN):
+            raise ValueError("Cannot aggregate " + str(event_type))
+
+        self.bucket = float(bucket)
+        self.event_type = event_type
+        self.bins = np.asarray(bins, dtype=float)
+
+        # (CH, bucket index) -> list of accumulators, one per spec
+        self._groups = {}
+
+    def _columns(self, chunk):
+        """Flatten a chunk into per-channel (CH, RTOT, {column: values})"""
+        t = np.asarray(chunk[TIME], dtype=float)
+        columns = {c for c, _ in self.specs if c is not None}
+
+        if self.event_type is EventType.HIT:
+            ch = np.asarray(chunk['CH'], dtype=np.int64)
+            values = {c: np.asarray(chunk[c], dtype=float) for c in columns}
+            return ch, t, values
+
+        # Time-driven rows carry one block of features per CID
+        cids = _td_cids(chunk.dtype.names)
+        ch = np.repeat(np.array(cids, dtype=np.int64), len(t))
+        values = {c: np.concatenate(
+            [np.asarray(chunk['CID%d_%s' % (cid, c)], dtype=float)
+             for cid in cids]
+            + [np.empty(0)]) for c in columns}
+        return ch, np.tile(t, len(cids)), values
+
+    def update(self, chunk):
+        """Fold a recarray chunk (e.g. from :func:`iter_chunks`) into the
+        running state"""
+        if len(chunk) == 0:
+            return
+        ch, t, values = self._columns(chunk)
+        if len(ch) == 0:
+            return
+
+        keys = np.stack([ch, np.floor(t/self.bucket).astype(np.int64)], 1)
+        keys, inv = np.unique(keys, axis=0, return_inverse=True)
+        inv = inv.ravel()
+        n = len(keys)
+
+        partials = []
+        for column, reduction in self.specs:
+            if column is None:
+                partials.append(np.bincount(inv, minlength=n))
+                continue
+
+            v = values[column]
+            valid = ~np.isnan(v)
+            g = inv[valid]
+            v = v[valid]
+
+            if reduction == 'count':
+                partials.append(np.bincount(g, minlength=n))
+            elif reduction == 'sum':
+                partials.append(np.bincount(g, weights=v, minlength=n))
+            elif reduction == 'min':
+                out = np.full(n, np.inf)
+                np.minimum.at(out, g, v)
+                partials.append(out)
+            elif reduction == 'max':
+                out = np.full(n, -np.inf)
+                np.maximum.at(out, g, v)
+                partials.append(out)
+            elif reduction == 'mean':
+                partials.append(np.stack(
+                    [np.bincount(g, weights=v, minlength=n),
+                     np.bincount(g, minlength=n)], 1))
+            elif reduction == 'hist':
+                nbins = len(self.bins) - 1
+                b = np.searchsorted(self.bins, v, side='right') - 1
+                # Right edge is inclusive, as in numpy.histogram
+                b[v == self.bins[-1]] = nbins - 1
+                inside = (b >= 0) & (b < nbins)
+                partials.append(np.bincount(
+                    g[inside]*nbins + b[inside],
+                    minlength=n*nbins).reshape(n, nbins))
+
+        for i, (c, b) in enumerate(keys.tolist()):
+            self._fold((c, b), [p[i] for p in partials])
+
+    def _fold(self, key, accumulators):
+        """Combine one group's accumulators into the running state"""
+        state = self._groups.get(key)
+        if state is None:
+            self._groups[key] = [np.array(a, dtype=float) if r == 'mean'
+                                 else a.copy() if r == 'hist' else a
+                                 for a, (_, r) in zip(accumulators,
+                                                      self.specs)]
+            return
+
+        for i, (_, reduction) in enumerate(self.specs):
+            if reduction == 'min':
+                state[i] = min(state[i], accumulators[i])
+            elif reduction == 'max':
+                state[i] = max(state[i], accumulators[i])
+            else:
+                state[i] = state[i] + accumulators[i]
+
+    def merge(self, other):
+        """Merge another Aggregator with identical settings into this one"""
+        if (other.specs != self.specs or other.bucket != self.bucket
+                or other.event_type is not self.event_type
+                or not np.array_equal(other.bins, self.bins)):
+            raise ValueError("Cannot merge aggregators with different "
+                             "specs, bucket width or bins")
+        for key, accumulators in other._groups.items():
+            self._fold(key, accumulators)
+        return self
+
+    def result(self):
+        """Return the aggregated table as a recarray sorted by CH, BUCKET.
+
+        BUCKET holds the start time of each bucket in seconds of RTOT.
+        Reduction columns are named ``<column>_<reduction>`` (``COUNT`` for
+        a count spec without a column); ``hist`` columns hold one count per
+        bin.  Groups without valid values report NaN for min, max and mean.
+        """
+        dtype = [('CH', np.int64), ('BUCKET', float)]
+        for column, reduction in self.specs:
+            name = _field_name(column, reduction)
+            if reduction == 'hist':
+                dtype.append((name, np.int64, (len(self.bins) - 1,)))
+            elif reduction == 'count':
+                dtype.append((name, np.int64))
+            else:
+                dtype.append((name, float))
+
+        keys = sorted(self._groups)
+        out = np.zeros(len(keys), dtype=dtype).view(np.recarray)
+        for row, key in enumerate(keys):
+            out['CH'][row] = key[0]
+            out['BUCKET'][row] = key[1]*self.bucket
+            state = self._groups[key]
+            for i, (column, reduction) in enumerate(self.specs):
+                v = state[i]
+                if reduction == 'mean':
+                    v = v[0]/v[1] if v[1] else np.nan
+                elif reduction in ('min', 'max') and np.isinf(v):
+                    v = np.nan
+                out[_field_name(column, reduction)][row] = v
+        return out
+
+
+def _field_name(column, reduction):
+    if column is None:
+        return 'COUNT'
+    return '%s_%s' % (column, reduction)
+
+
+def aggregate(files, specs, bucket=1.0, event_type=EventType.HIT,
+              bins=AMP_BINS, chunk_size=65536):
+    """Compute per-channel, per-time-bucket reductions in one streaming pass.
+
+    Args:
+        files (str or list): path to a .DTA file, or list of paths for
+            continuation files (state is shared across files)
+        specs (list): ``(column, reduction)`` tuples, see :class:`Aggregator`
+        bucket (float): bucket width in seconds of RTOT
+        event_type (EventType): aggregate HIT or TIME_DRIVEN events
+        bins (array_like): histogram bin edges used by ``hist`` specs
+        chunk_size (int): number of events decoded per vectorized update
+    Returns:
+        agg (Aggregator): aggregator holding the state; call ``result()``
+            for the table, or ``merge()`` it with results of other workers
+    """
+    agg = Aggregator(specs, bucket=bucket, event_type=event_type, bins=bins)
+    include_td = event_type is EventType.TIME_DRIVEN
+    for ev_type, chunk in iter_chunks(files, chunk_size=chunk_size,
+                                      skip_wfm=True, include_td=include_td):
+        if ev_type is event_type:
+            agg.update(chunk)
+    return agg
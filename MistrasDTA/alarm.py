@@ -0,0 +1,197 @@
+import collections
+import time
+
+import numpy as np
+
+from .MistrasDTA import TIME, EventType, iter_chunks
+
+
+METRICS = ('hit_rate', 'energy_rate', 'amp')
+
+Rule = collections.namedtuple(
+    'Rule', ['name', 'metric', 'limit', 'window', 'channels', 'column'],
+    defaults=(1.0, None, None))
+Rule.__doc__ = """Alarm rule evaluated per channel.
+
+``metric`` is ``hit_rate`` (hits/s over the last ``window`` seconds),
+``energy_rate`` (sum of ``column``, ENER by default, per second over the
+window) or ``amp`` (``column`` of each hit, AMP by default).  The alarm
+is raised when the metric exceeds ``limit`` on one of ``channels`` (all
+channels if None)."""
+
+Alarm = collections.namedtuple(
+    'Alarm', ['rule', 'CH', 'time', 'value', 'latency'])
+Alarm.__doc__ = """Raised alarm: RTOT of the triggering hit, metric value
+and the seconds between the oldest hit of its chunk being read and the
+callback."""
+
+
+def rules_from_config(config, amp_margin=20, saturation=0.5, window=1.0):
+    """Build per-channel rules from the setup returned by ``read_bin``.
+
+    Args:
+        config (dict): config with ``threshold``, ``hdt`` and ``hlt``
+        amp_margin (float): dB above the channel threshold that raise an
+            ``amp`` alarm
+        saturation (float): fraction of the highest hit rate the channel
+            can record, ``1/(HDT+HLT)``, that raises a ``hit_rate`` alarm
+        window (float): hit rate window in seconds
+    Returns:
+        rules (list): one ``amp`` and one ``hit_rate`` Rule per channel
+    """
+    rules = []
+    for ch, threshold in sorted(config["threshold"].items()):
+        rules.append(Rule('AMP CH%d' % ch, 'amp', threshold + amp_margin,
+                          channels=(ch,)))
+        dead_time = config["hdt"].get(ch, 0) + config["hlt"].get(ch, 0)
+        if dead_time:
+            rules.append(Rule('HIT RATE CH%d' % ch, 'hit_rate',
+                              saturation*1e6/dead_time, window=window,
+                              channels=(ch,)))
+    return rules
+
+
+class AlarmEngine:
+    """Evaluates alarm rules on chunks of hits.
+
+    Each rule keeps the hits of the last ``window`` seconds per channel, so
+    windows span chunk boundaries.  The callback is called once when a
+    metric rises above its limit; the alarm re-arms when it drops back.
+    Hits are assumed to arrive in time order across chunks.
+
+    Args:
+        rules (list): :class:`Rule` objects
+        callback (callable): called with an :class:`Alarm`
+    """
+
+    def __init__(self, rules, callback):
+        for rule in rules:
+            if rule.metric not in METRICS:
+                raise ValueError("Unknown metric: " + str(rule.metric))
+        self.rules = list(rules)
+        self.callback = callback
+
+        # (rule index, CH) -> (times, values) still inside the window
+        self._carry = {}
+        # (rule index, CH) -> alarm currently raised
+        self._active = {}
+
+        # Seconds from reading the oldest hit of a chunk to the callbacks it
+        # caused
+        self.n_alarms = 0
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+
+    def _values(self, rule, chunk):
+        if rule.metric == 'hit_rate':
+            return np.ones(len(chunk))
+        column = rule.column or ('ENER' if rule.metric == 'energy_rate'
+                                 else 'AMP')
+        return np.asarray(chunk[column], dtype=float)
+
+    def update(self, chunk, received=None):
+        """Evaluate all rules on a recarray chunk of hits.
+
+        Args:
+            chunk (recarray): hits, e.g. from :func:`iter_chunks`
+            received (float): ``time.perf_counter()`` when the oldest hit
+                of the chunk was read, e.g. from the ``read_times`` of
+                :func:`iter_chunks`; defaults to now
+        Returns:
+            alarms (list): the alarms raised by this chunk
+        """
+        if received is None:
+            received = time.perf_counter()
+        if len(chunk) == 0:
+            return []
+
+        order = np.argsort(chunk[TIME], kind='stable')
+        t = np.asarray(chunk[TIME], dtype=float)[order]
+        ch = np.asarray(chunk['CH'])[order]
+
+        raised = []
+        for r, rule in enumerate(self.rules):
+            values = self._values(rule, chunk)[order]
+            channels = np.unique(ch) if rule.channels is None else \
+                rule.channels
+            for c in channels:
+                sel = ch == c
+                if not sel.any():
+                    continue
+                raised += self._evaluate(r, rule, int(c), t[sel],
+                                         values[sel])
+
+        alarms = []
+        for alarm in raised:
+            latency = time.perf_counter() - received
+            alarm = alarm._replace(latency=latency)
+            self.callback(alarm)
+            alarms.append(alarm)
+            self.n_alarms += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+        return alarms
+
+    def _evaluate(self, r, rule, c, t, v):
+        key = (r, c)
+        if rule.metric == 'amp':
+            metric = v
+        else:
+            t_old, v_old = self._carry.get(key, (np.empty(0), np.empty(0)))
+            n_old = len(t_old)
+            t_all = np.concatenate([t_old, t])
+            v_all = np.concatenate([v_old, v])
+            cs = np.concatenate([[0.0], np.cumsum(v_all)])
+
+            # Sum over (t - window, t] for each new hit
+            left = np.searchsorted(t_all, t - rule.window, side='right')
+            right = n_old + np.arange(1, len(t) + 1)
+            metric = (cs[right] - cs[left])/rule.window
+
+            keep = t_all > t_all[-1] - rule.window
+            self._carry[key] = (t_all[keep], v_all[keep])
+
+        exceeded = metric > rule.limit
+        before = np.concatenate([[self._active.get(key, False)],
+                                 exceeded[:-1]])
+        self._active[key] = bool(exceeded[-1])
+
+        return [Alarm(rule, c, float(t[i]), float(metric[i]), None)
+                for i in np.flatnonzero(exceeded & ~before)]
+
+    @property
+    def mean_latency(self):
+        """Mean seconds from reading a chunk to its alarm callbacks"""
+        return self.total_latency/self.n_alarms if self.n_alarms else 0.0
+
+
+def evaluate(files, rules, callback, chunk_size=1024, max_delay=None):
+    """Stream hits from .DTA files through an :class:`AlarmEngine`.
+
+    Small chunks keep the delay between a hit being read and its alarm
+    short; larger chunks amortize the per-chunk overhead.  ``max_delay``
+    bounds how long a hit waits for its chunk to fill, and alarm latencies
+    are measured from when the oldest hit of the chunk was read, so they
+    include reading, decoding and buffering.
+
+    Args:
+        files (str or list): path to a .DTA file, or list of paths for
+            continuation files (state is shared across files)
+        rules (list): :class:`Rule` objects, see also
+            :func:`rules_from_config`
+        callback (callable): called with each :class:`Alarm`
+        chunk_size (int): hits per evaluation
+        max_delay (float): if not None, seconds after which a partial
+            chunk is evaluated, see :func:`iter_chunks`
+    Returns:
+        engine (AlarmEngine): the engine, with latency statistics
+    """
+    engine = AlarmEngine(rules, callback)
+    read_times = []
+    for ev_type, chunk in iter_chunks(files, chunk_size=chunk_size,
+                                      skip_wfm=True, max_delay=max_delay,
+                                      read_times=read_times):
+        received = read_times.pop()
+        if ev_type is EventType.HIT:
+            engine.update(chunk, received=received)
+    return engine
@@ -0,0 +1,219 @@
+import numpy as np
+from numpy.lib.recfunctions import append_fields
+
+from .MistrasDTA import EventType, iter_chunks
+
+
+def rise_angle(table):
+    """RA value: rise time over peak amplitude in ms/V.
+
+    AMP is converted from dB (referenced to 1 µV at the sensor) to volts,
+    so 0 dB is 1 µV and the amplitude is never zero.
+    """
+    rise = np.asarray(table['RISE'], dtype=float)*1e-3
+    amp = 1e-6*10**(np.asarray(table['AMP'], dtype=float)/20)
+    return rise/amp
+
+
+def average_frequency(table):
+    """AF: threshold crossings over duration in kHz; NaN for zero duration"""
+    counts = np.asarray(table['COUN'], dtype=float)
+    duration = np.asarray(table['DURATION'], dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(duration > 0, 1e3*counts/duration, np.nan)
+
+
+# Derived features computed from hit columns
+FEATURES = {'RA': rise_angle, 'AF': average_frequency}
+
+
+def features(table, names=('RA', 'AF')):
+    """Compute derived features or plain columns of a rec table or chunk.
+
+    Args:
+        table (recarray): hits, e.g. from :func:`read_bin` or a chunk from
+            :func:`iter_chunks`
+        names (iterable): names from ``FEATURES`` or columns of table
+    Returns:
+        X (numpy.ndarray): float array of shape ``(len(table), len(names))``
+    """
+    columns = []
+    for name in names:
+        if name in FEATURES:
+            columns.append(FEATURES[name](table))
+        else:
+            columns.append(np.asarray(table[name], dtype=float))
+    return np.stack(columns, 1) if columns else np.empty((len(table), 0))
+
+
+def add_columns(rec, columns):
+    """Return rec with extra columns appended, e.g. features or labels.
+
+    Args:
+        rec (recarray): table of hits
+        columns (dict): column name -> array aligned with the rows of rec
+    Returns:
+        rec (recarray): a new table with the columns appended
+    """
+    names = list(columns)
+    return append_fields(rec, names, [np.asarray(columns[n]) for n in names],
+                         usemask=False, asrecarray=True)
+
+
+class MiniBatchKMeans:
+    """k-means clustering updated one batch of hits at a time.
+
+    Centers are seeded with k-means++ on the first ``n_clusters`` or more
+    valid rows and then moved towards the mean of the rows assigned to
+    them in each batch, with a per-center learning rate of one over the
+    number of rows seen.  Rows with a NaN feature are ignored.
+
+    Features are standardized with ``mean`` and ``scale`` before
+    clustering; :func:`cluster` estimates them in a first pass.
+
+    Args:
+        n_clusters (int): number of clusters
+        names (iterable): features to cluster on, see :func:`features`
+        batch_size (int): rows per center update
+        mean (array_like): per-feature offset, 0 if None
+        scale (array_like): per-feature divisor, 1 if None
+        seed (int): seed of the k-means++ initialization
+    """
+
+    def __init__(self, n_clusters, names=('RA', 'AF'), batch_size=1024,
+                 mean=None, scale=None, seed=None):
+        self.n_clusters = n_clusters
+        self.names = tuple(names)
+        self.batch_size = batch_size
+        self.mean = np.zeros(len(self.names)) if mean is None else \
+            np.asarray(mean, dtype=float)
+        self.scale = np.ones(len(self.names)) if scale is None else \
+            np.asarray(scale, dtype=float)
+        self.centers = None
+        self.counts = np.zeros(n_clusters, dtype=np.int64)
+        self._rng = np.random.default_rng(seed)
+        self._pending = []
+
+    def _transform(self, table):
+        return (features(table, self.names) - self.mean)/self.scale
+
+    def _init_centers(self, X):
+        """k-means++ seeding"""
+        centers = [X[self._rng.integers(len(X))]]
+        d2 = ((X - centers[0])**2).sum(1)
+        for _ in range(1, self.n_clusters):
+            total = d2.sum()
+            i = self._rng.choice(len(X), p=d2/total) if total > 0 else \
+                self._rng.integers(len(X))
+            centers.append(X[i])
+            d2 = np.minimum(d2, ((X - X[i])**2).sum(1))
+        return np.array(centers)
+
+    def _assign(self, X):
+        d2 = ((X[:, None, :] - self.centers[None, :, :])**2).sum(2)
+        return np.argmin(d2, 1)
+
+    def _step(self, X):
+        labels = self._assign(X)
+        n = np.bincount(labels, minlength=self.n_clusters)
+        sums = np.stack([np.bincount(labels, weights=X[:, j],
+                                     minlength=self.n_clusters)
+                         for j in range(X.shape[1])], 1)
+        self.counts += n
+        moved = n > 0
+        self.centers[moved] += ((sums[moved]
+                                 - n[moved, None]*self.centers[moved])
+                                / self.counts[moved, None])
+
+    def partial_fit(self, table):
+        """Update the centers with the hits of a table or chunk"""
+        X = self._transform(table)
+        X = X[np.isfinite(X).all(1)]
+
+        if self.centers is None:
+            self._pending.append(X)
+            X = np.concatenate(self._pending)
+            if len(X) < self.n_clusters:
+                return self
+            self._pending = []
+            self.centers = self._init_centers(X)
+
+        for start in range(0, len(X), self.batch_size):
+            self._step(X[start:start+self.batch_size])
+        return self
+
+    def predict(self, table):
+        """Cluster index of each hit; -1 where a feature is NaN"""
+        if self.centers is None:
+            raise ValueError("MiniBatchKMeans has not been fitted")
+        X = self._transform(table)
+        valid = np.isfinite(X).all(1)
+        labels = np.full(len(X), -1, dtype=np.int64)
+        if valid.any():
+            labels[valid] = self._assign(X[valid])
+        return labels
+
+    @property
+    def cluster_centers(self):
+        """Centers in the units of the features"""
+        return self.centers*self.scale + self.mean
+
+
+def _hit_chunks(files, chunk_size):
+    for ev_type, chunk in iter_chunks(files, chunk_size=chunk_size,
+                                      skip_wfm=True):
+        if ev_type is EventType.HIT:
+            yield chunk
+
+
+def cluster(files, n_clusters, names=('RA', 'AF'), chunk_size=65536,
+            n_epochs=1, batch_size=1024, seed=None):
+    """Cluster the hits of .DTA files without loading the rec table.
+
+    Features are standardized with their mean and standard deviation from a
+    first pass, the centers are fitted in ``n_epochs`` passes and a last
+    pass labels every hit.
+
+    Args:
+        files (str or list): path to a .DTA file, or list of paths for
+            continuation files (state is shared across files)
+        n_clusters (int): number of clusters
+        names (iterable): features to cluster on, see :func:`features`
+        chunk_size (int): number of hits decoded per chunk
+        n_epochs (int): passes over the hits to fit the centers
+        batch_size (int): rows per center update
+        seed (int): seed of the k-means++ initialization
+    Returns:
+        model (MiniBatchKMeans): the fitted model
+        labels (numpy.ndarray): cluster of each hit, aligned with the rows
+            of the rec table from :func:`read_bin` (-1 for NaN features)
+    """
+    names = tuple(names)
+    n = np.zeros(len(names))
+    total = np.zeros(len(names))
+    total2 = np.zeros(len(names))
+    for chunk in _hit_chunks(files, chunk_size):
+        X = features(chunk, names)
+        valid = np.isfinite(X)
+        X = np.where(valid, X, 0)
+        n += valid.sum(0)
+        total += X.sum(0)
+        total2 += (X**2).sum(0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.where(n > 0, total/n, 0)
+        std = np.sqrt(np.maximum(total2/n - mean**2, 0))
+    scale = np.where(std > 0, std, 1)
+
+    model = MiniBatchKMeans(n_clusters, names, batch_size=batch_size,
+                            mean=mean, scale=scale, seed=seed)
+    for _ in range(n_epochs):
+        for chunk in _hit_chunks(files, chunk_size):
+            model.partial_fit(chunk)
+    if model.centers is None:
+        raise ValueError("Fewer hits with valid features than clusters")
+
+    labels = [model.predict(chunk)
+              for chunk in _hit_chunks(files, chunk_size)]
+    labels = np.concatenate(labels) if labels else np.empty(0, np.int64)
+    return model, labels
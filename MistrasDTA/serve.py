@@ -0,0 +1,297 @@
+import collections
+import io
+import json
+import os
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from .MistrasDTA import TIME, _ByteLRU, read_bin
+
+
+# Table served by each endpoint
+ENDPOINTS = {'/hits': 'rec', '/td': 'td', '/wfm': 'wfm'}
+
+# Errors raised by read_bin() on files it cannot decode
+DECODE_ERRORS = (struct.error, KeyError, IndexError, ValueError)
+
+
+class UnknownColumnError(ValueError):
+    """Raised by :meth:`DecodedFile.query` for columns not in the table"""
+
+
+class DecodedFile:
+    """Tables of a .DTA file, or a chain of continuation files, sorted by
+    time for range queries"""
+
+    def __init__(self, paths):
+        rec, wfm, td, config = read_bin(paths, include_td=True,
+                                        include_config=True)
+        self.config = config
+        self.tables = {}
+        for name, table in (('rec', rec), ('wfm', wfm), ('td', td)):
+            if not hasattr(table, 'dtype'):
+                continue
+            table = np.asarray(table)
+            self.tables[name] = table[np.argsort(table[TIME],
+                                                 kind='stable')]
+        self.nbytes = sum(t.nbytes for t in self.tables.values())
+
+    def query(self, table, t0=None, t1=None, channels=None, columns=None):
+        """Rows with t0 <= time < t1 on the given channels.
+
+        For time-driven data, ``channels`` selects the per-CID columns
+        instead of rows.
+        """
+        data = self.tables.get(table)
+        if data is None:
+            return np.empty(0, dtype=[(TIME, float)])
+
+        t = data[TIME]
+        lo = 0 if t0 is None else np.searchsorted(t, t0, side='left')
+        hi = len(t) if t1 is None else np.searchsorted(t, t1, side='left')
+        data = data[lo:hi]
+
+        names = list(data.dtype.names)
+        if channels is not None:
+            if table == 'td':
+                prefixes = tuple('CID%d_' % c for c in channels)
+                names = [n for n in names if not n.startswith('CID')
+                         or n.startswith(prefixes)]
+            else:
+                data = data[np.isin(data['CH'], list(channels))]
+        if columns is not None:
+            unknown = set(columns) - set(names)
+            if unknown:
+                raise UnknownColumnError(', '.join(sorted(unknown)))
+            names = [n for n in names if n in columns or n == TIME]
+
+        out = np.empty(len(data), dtype=[(n, data.dtype[n]) for n in names])
+        for n in names:
+            out[n] = data[n]
+        return out
+
+
+class FileCache:
+    """LRU cache of decoded files bounded by the size of their tables.
+
+    Entries are keyed by the paths, sizes and mtimes of a file chain, so
+    files that are rewritten are decoded again.  Concurrent requests for
+    the same chain wait for a single decode.
+    """
+
+    def __init__(self, max_bytes=1 << 30):
+        self.hits = 0
+        self.misses = 0
+        self._entries = _ByteLRU(max_bytes)
+        self._lock = threading.Lock()
+        self._loading = {}
+
+    def get(self, paths):
+        """Decoded tables of a list of continuation files"""
+        key = []
+        for path in paths:
+            st = os.stat(path)
+            key.append((path, st.st_size, st.st_mtime_ns))
+        key = tuple(key)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                return entry
+            self.misses += 1
+            loading = self._loading.get(key)
+            if loading is None:
+                loading = self._loading[key] = threading.Lock()
+
+        with loading:
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is None:
+                try:
+                    entry = DecodedFile(paths)
+                except BaseException:
+                    with self._lock:
+                        self._loading.pop(key, None)
+                    raise
+                # Requests arriving after this find the entry
+                with self._lock:
+                    self._entries.put(key, entry, entry.nbytes)
+                    self._loading.pop(key, None)
+        return entry
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries),
+                    'bytes': self._entries.nbytes,
+                    'max_bytes': self._entries.max_bytes, 'hits': self.hits,
+                    'misses': self.misses}
+
+
+class LatencyStats:
+    """Per-endpoint request latencies in milliseconds"""
+
+    def __init__(self, keep=1024):
+        self._lock = threading.Lock()
+        self._latencies = collections.defaultdict(
+            lambda: collections.deque(maxlen=keep))
+        self._counts = collections.Counter()
+
+    def add(self, endpoint, ms):
+        with self._lock:
+            self._latencies[endpoint].append(ms)
+            self._counts[endpoint] += 1
+
+    def summary(self):
+        with self._lock:
+            out = {}
+            for endpoint, values in self._latencies.items():
+                v = np.array(values)
+                out[endpoint] = {
+                    'count': self._counts[endpoint],
+                    'mean_ms': float(v.mean()),
+                    'p50_ms': float(np.percentile(v, 50)),
+                    'p95_ms': float(np.percentile(v, 95)),
+                    'max_ms': float(v.max())}
+            return out
+
+
+def _parse_query(query):
+    """Extract t0, t1, channels and columns from a parsed query string"""
+    def one(name, cast):
+        values = query.get(name)
+        return None if not values else cast(values[0])
+
+    def many(name, cast):
+        values = query.get(name)
+        if not values:
+            return None
+        return [cast(v) for v in ','.join(values).split(',') if v]
+
+    return {'t0': one('t0', float), 't1': one('t1', float),
+            'channels': many('ch', int), 'columns': many('cols', str)}
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """Answers ``GET /hits``, ``/td``, ``/wfm`` and ``/metrics``.
+
+    Table endpoints take ``file`` (path relative to the served root,
+    repeated in order for continuation files) and the optional ``t0``,
+    ``t1``, ``ch`` and ``cols`` parameters, and respond with the matching
+    rows as a ``.npy`` structured array.  Errors are answered with a JSON
+    ``error`` message.
+    """
+
+    server_version = 'MistrasDTA'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        start = time.perf_counter()
+        endpoint = urlsplit(self.path).path
+        try:
+            status, body, content_type = self._answer(endpoint)
+        except Exception as e:
+            status, body, content_type = _error(
+                500, 'internal error: %s' % type(e).__name__)
+
+        # Latency includes errors; unknown paths share one entry
+        if endpoint not in ENDPOINTS and endpoint != '/metrics':
+            endpoint = 'other'
+        self.server.latency.add(endpoint, 1e3*(time.perf_counter() - start))
+        self._send(status, body, content_type)
+
+    def _answer(self, endpoint):
+        """Return the status, body and content type of the response"""
+        if endpoint == '/metrics':
+            body = json.dumps({'latency': self.server.latency.summary(),
+                               'cache': self.server.cache.stats()})
+            return 200, body.encode(), 'application/json'
+
+        table = ENDPOINTS.get(endpoint)
+        if table is None:
+            return _error(404, 'unknown endpoint ' + endpoint)
+
+        query = parse_qs(urlsplit(self.path).query)
+        try:
+            paths = [self.server.resolve(name)
+                     for name in query.get('file', [''])]
+            params = _parse_query(query)
+        except ValueError as e:
+            return _error(400, str(e))
+
+        try:
+            entry = self.server.cache.get(paths)
+        except FileNotFoundError:
+            return _error(404, 'no such file')
+        except OSError as e:
+            return _error(400, 'cannot read file: %s' % (e.strerror or e))
+        except DECODE_ERRORS as e:
+            return _error(422, 'cannot decode file: %r' % e)
+
+        try:
+            result = entry.query(table, **params)
+        except UnknownColumnError as e:
+            return _error(400, 'unknown columns: ' + str(e))
+
+        buf = io.BytesIO()
+        np.lib.format.write_array(buf, result, allow_pickle=False)
+        return 200, buf.getvalue(), 'application/octet-stream'
+
+
+def _error(status, message):
+    """JSON error response for QueryHandler"""
+    return status, json.dumps({'error': message}).encode(), \
+        'application/json'
+
+
+class QueryServer(ThreadingHTTPServer):
+    """Threaded HTTP server answering queries over the .DTA files in root.
+
+    Args:
+        root (str): directory holding the .DTA archive
+        address (tuple): ``(host, port)`` to bind; localhost by default
+        max_bytes (int): memory bound of the decoded-file cache
+    """
+
+    daemon_threads = True
+
+    def __init__(self, root, address=('127.0.0.1', 8765),
+                 max_bytes=1 << 30):
+        super().__init__(address, QueryHandler)
+        self.root = os.path.realpath(root)
+        self.cache = FileCache(max_bytes)
+        self.latency = LatencyStats()
+
+    def resolve(self, name):
+        """Map a file parameter to a path, refusing paths outside root"""
+        if not name:
+            raise ValueError('missing file parameter')
+        path = os.path.realpath(os.path.join(self.root, name))
+        if os.path.commonpath([self.root, path]) != self.root:
+            raise ValueError('file outside of the served directory')
+        return path
+
+
+def serve(root, host='127.0.0.1', port=8765, max_bytes=1 << 30):
+    """Serve queries over the .DTA files in root until interrupted"""
+    with QueryServer(root, (host, port), max_bytes=max_bytes) as server:
+        host, port = server.server_address[:2]
+        print('Serving {0} on http://{1}:{2}'.format(root, host, port))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,249 @@
+import os
+import pickle
+import struct
+import sys
+import time
+import uuid
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .MistrasDTA import EventType, _read_config, iter_chunks
+
+
+TABLES = {EventType.HIT: 'rec',
+          EventType.WAVEFORM: 'wfm',
+          EventType.TIME_DRIVEN: 'td'}
+
+# Manifest header: sequence number (odd while being written), payload length
+_HEADER = struct.Struct('<QI')
+
+
+def _open(name):
+    """Attach to an existing segment without handing it to the resource
+    tracker, which would otherwise unlink it when this process exits"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13: attaching registers the segment, undo that
+        shm = shared_memory.SharedMemory(name=name)
+        if os.name == 'posix':
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class SharedPublisher:
+    """Owner of the shared memory segments holding decoded tables.
+
+    Every published chunk is copied into its own segment.  A manifest
+    segment named ``name`` describes the config and all chunks published so
+    far, so consumers can :func:`attach` by name and pick up new chunks
+    with :meth:`SharedView.refresh` while decoding is still in progress.
+
+    Args:
+        name (str): manifest segment name; a random name is used if None
+        config (dict): setup state to hand to consumers
+        manifest_size (int): bytes reserved for the manifest
+    """
+
+    def __init__(self, name=None, config=None, manifest_size=1 << 20):
+        self.name = name or 'mistrasdta_' + uuid.uuid4().hex[:12]
+        self._manifest = shared_memory.SharedMemory(
+            name=self.name, create=True, size=manifest_size)
+        self._segments = []
+        self._sequence = 0
+        self.descriptor = {'config': config or {},
+                           'chunks': {t: [] for t in TABLES.values()},
+                           'complete': False}
+        self._write_manifest()
+
+    def _write_manifest(self):
+        payload = pickle.dumps(self.descriptor)
+        if _HEADER.size + len(payload) > self._manifest.size:
+            raise ValueError("Manifest is full, increase manifest_size")
+        buf = self._manifest.buf
+        _HEADER.pack_into(buf, 0, self._sequence + 1, len(payload))
+        buf[_HEADER.size:_HEADER.size+len(payload)] = payload
+        self._sequence += 2
+        _HEADER.pack_into(buf, 0, self._sequence, len(payload))
+
+    def append(self, table, chunk):
+        """Publish a chunk of the rec, wfm or td table"""
+        chunk = np.asarray(chunk)
+        if chunk.dtype.hasobject:
+            raise TypeError("Chunks with object columns cannot be shared")
+        shm = shared_memory.SharedMemory(
+            name='%s_%d' % (self.name, len(self._segments)),
+            create=True, size=max(chunk.nbytes, 1))
+        np.ndarray(chunk.shape, chunk.dtype, buffer=shm.buf)[:] = chunk
+        self._segments.append(shm)
+        self.descriptor['chunks'][table].append(
+            (shm.name, np.lib.format.dtype_to_descr(chunk.dtype),
+             len(chunk)))
+        self._write_manifest()
+
+    def finish(self):
+        """Mark the publication as complete"""
+        self.descriptor['complete'] = True
+        self._write_manifest()
+
+    def close(self):
+        """Close this process' handles to the segments"""
+        for shm in self._segments + [self._manifest]:
+            shm.close()
+
+    def unlink(self):
+        """Close and destroy all segments; attached views stay valid until
+        they are closed"""
+        self.close()
+        for shm in self._segments + [self._manifest]:
+            if os.name == 'posix':
+                # A view attached by a process that shares this process'
+                # resource tracker has unregistered the segment, see _open()
+                from multiprocessing import resource_tracker
+                resource_tracker.register(shm._name, 'shared_memory')
+            shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.unlink()
+
+
+class SharedView:
+    """Zero-copy view of tables published by a :class:`SharedPublisher`.
+
+    ``view['rec']`` (or ``'wfm'``, ``'td'``) is a list of recarray chunks
+    backed directly by the shared segments.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._manifest = _open(name)
+        self._segments = []
+        self.config = {}
+        self.complete = False
+        self.chunks = {t: [] for t in TABLES.values()}
+        self.refresh()
+
+    def _read_manifest(self):
+        buf = self._manifest.buf
+        while True:
+            sequence, length = _HEADER.unpack_from(buf, 0)
+            if sequence % 2 == 0:
+                payload = bytes(buf[_HEADER.size:_HEADER.size+length])
+                if _HEADER.unpack_from(buf, 0)[0] == sequence:
+                    return pickle.loads(payload)
+            time.sleep(0)
+
+    def refresh(self):
+        """Attach chunks published since the last call; returns the number
+        of new chunks"""
+        descriptor = self._read_manifest()
+        self.config = descriptor['config']
+        self.complete = descriptor['complete']
+
+        n_new = 0
+        for table, chunks in descriptor['chunks'].items():
+            for shm_name, descr, n in chunks[len(self.chunks[table]):]:
+                shm = _open(shm_name)
+                self._segments.append(shm)
+                dtype = np.lib.format.descr_to_dtype(descr)
+                # frombuffer() exports the buffer, so closing the segment
+                # fails instead of unmapping memory that is still in use
+                self.chunks[table].append(np.frombuffer(
+                    shm.buf, dtype, count=n).view(np.recarray))
+                n_new += 1
+        return n_new
+
+    def wait(self, timeout=None, poll=0.01):
+        """Refresh until the publisher has finished; returns ``complete``"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.complete:
+            self.refresh()
+            if deadline is not None and time.monotonic() > deadline:
+                break
+            if not self.complete:
+                time.sleep(poll)
+        self.refresh()
+        return self.complete
+
+    def __getitem__(self, table):
+        return self.chunks[table]
+
+    def close(self):
+        """Release the views and close this process' handles.
+
+        Raises BufferError if chunks (or arrays derived from them) are
+        still referenced; the segments stay mapped until they are released
+        and close() is called again.
+        """
+        self.chunks = {t: [] for t in TABLES.values()}
+        in_use = []
+        for shm in self._segments + [self._manifest]:
+            try:
+                shm.close()
+            except BufferError:
+                in_use.append(shm)
+        self._segments = in_use
+        if in_use:
+            raise BufferError("%d shared chunks are still referenced"
+                              % len(in_use))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def publish(files, name=None, chunk_size=None, skip_wfm=False,
+            include_td=True, manifest_size=1 << 20):
+    """Decode .DTA files once and publish the tables to shared memory.
+
+    Consumers in other processes call :func:`attach` with the publisher's
+    ``name``.  With ``chunk_size`` set, chunks become visible to attached
+    consumers as soon as they are decoded.
+
+    Args:
+        files (str or list): path to a .DTA file, or list of paths for
+            continuation files (state is shared across files)
+        name (str): manifest segment name; a random name is used if None
+        chunk_size (int): rows per published chunk; one chunk per table
+            if None
+        skip_wfm (bool): do not publish waveforms if True
+        include_td (bool): publish time-driven data if True
+        manifest_size (int): bytes reserved for the manifest
+    Returns:
+        publisher (SharedPublisher): owner of the segments; keep it alive
+            while consumers are attached and call ``unlink()`` when done
+    """
+    if isinstance(files, str):
+        files = [files]
+
+    with open(files[0], "rb") as f:
+        config = _read_config(f)
+
+    publisher = SharedPublisher(name, config=config,
+                                manifest_size=manifest_size)
+    try:
+        for ev_type, chunk in iter_chunks(
+                files, chunk_size=chunk_size or sys.maxsize,
+                skip_wfm=skip_wfm, include_td=include_td):
+            publisher.append(TABLES[ev_type], chunk)
+        publisher.finish()
+    except BaseException:
+        publisher.unlink()
+        raise
+    return publisher
+
+
+def attach(name):
+    """Attach to tables published under ``name`` by :func:`publish`.
+
+    Returns:
+        view (SharedView): zero-copy chunks per table plus the config
+    """
+    return SharedView(name)
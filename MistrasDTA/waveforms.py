@@ -0,0 +1,171 @@
+import threading
+
+import numpy as np
+
+from .MistrasDTA import (TIME, _amp_scale_factor, _ByteLRU, _bytes_to_RTOT,
+                         _iter_frames, _read_config)
+
+
+# Bytes of a MID 173 body before the samples: SUBID, TOT, CID, ALB
+_WFM_HEADER = 9
+
+_INDEX_DTYPE = [(TIME, float), ('CH', np.int64),
+                ('SRATE', np.int64), ('TDLY', np.int64),
+                ('FILE', np.int64), ('OFFSET', np.int64), ('N', np.int64)]
+
+
+class WaveformStore:
+    """Waveforms of .DTA files decoded on demand from an offset index.
+
+    Opening the store scans the files once and keeps only the position,
+    time and channel of each waveform message.  Waveforms are read and
+    calibrated to volts when requested, and the most recent ones are kept
+    in an LRU cache bounded by ``max_bytes``.  Time axes are shared between
+    waveforms with the same SRATE, TDLY and length.
+
+    Waveform ``i`` is row ``i`` of the wfm table returned by
+    :func:`read_bin` for the same files.
+
+    Args:
+        files (str or list): path to a .DTA file, or list of paths for
+            continuation files (state is shared across files)
+        max_bytes (int): memory bound of the cached voltage arrays
+    """
+
+    def __init__(self, files, max_bytes=64 << 20):
+        if isinstance(files, str):
+            files = [files]
+        self.files = list(files)
+        self.hits = 0
+        self.misses = 0
+
+        self._cache = _ByteLRU(max_bytes)
+        self._time_axes = {}
+        self._handles = {}
+        # _lock guards the cache and counters, _io_lock the open files, so
+        # cache hits do not wait for another thread's reads
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+
+        rows = []
+        config = None
+        for i, file in enumerate(self.files):
+            with open(file, 'rb', buffering=1 << 20) as data:
+                if config is None:
+                    config = _read_config(data)
+                for offset, MID, body in _iter_frames(data):
+                    if MID != 173:
+                        continue
+                    CID = body[7]
+                    hw = config["hardware_cfg"][CID]
+                    rows.append((
+                        _bytes_to_RTOT(body[1:7]), CID, hw['SRATE'],
+                        hw['TDLY'], i, offset + 3 + _WFM_HEADER,
+                        (len(body) - _WFM_HEADER)//2))
+
+        self.config = config
+        self.index = np.rec.fromrecords(rows, dtype=_INDEX_DTYPE) if rows \
+            else np.recarray(0, dtype=_INDEX_DTYPE)
+
+        # Volts per count for each channel, as in iter_bin
+        self._scale = {CID: _amp_scale_factor(g)
+                       for CID, g in config["gain"].items()}
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        return self.get(i)
+
+    def time_axis(self, i):
+        """Time in microseconds of the samples of waveform i; read-only and
+        shared by all waveforms with the same SRATE, TDLY and length"""
+        row = self.index[i]
+        key = (int(row['SRATE']), int(row['TDLY']), int(row['N']))
+        with self._lock:
+            t = self._time_axes.get(key)
+            if t is None:
+                SRATE, TDLY, N = key
+                t = 1e6*(np.arange(0, N) + TDLY)/SRATE
+                t.flags.writeable = False
+                self._time_axes[key] = t
+        return t
+
+    def get(self, i):
+        """Time (µs) and voltage of waveform i, like get_waveform_data()"""
+        return self.get_many([i])[0]
+
+    def get_many(self, indices):
+        """Time and voltage of several waveforms.
+
+        Waveforms that are not cached are read in file and offset order,
+        so a batch costs one forward pass over the files.
+
+        Args:
+            indices (iterable): waveform numbers
+        Returns:
+            waveforms (list): ``(t, V)`` tuples in the order of indices;
+                the arrays are read-only
+        """
+        indices = [int(i) for i in indices]
+        n = len(self.index)
+        for i in indices:
+            if not -n <= i < n:
+                raise IndexError("waveform index out of range: %d" % i)
+        indices = [i % n for i in indices]
+
+        with self._lock:
+            found = {}
+            for i in indices:
+                V = self._cache.get(i)
+                if V is not None:
+                    found[i] = V
+            self.hits += sum(i in found for i in indices)
+
+            missing = sorted(set(indices) - set(found),
+                             key=lambda i: (self.index['FILE'][i],
+                                            self.index['OFFSET'][i]))
+            self.misses += len(missing)
+
+        if missing:
+            with self._io_lock:
+                read = {i: self._read(i) for i in missing}
+            with self._lock:
+                for i, V in read.items():
+                    self._cache.put(i, V, V.nbytes)
+            found.update(read)
+
+        return [(self.time_axis(i), found[i]) for i in indices]
+
+    def _read(self, i):
+        row = self.index[i]
+        data = self._handles.get(int(row['FILE']))
+        if data is None:
+            data = self._handles[int(row['FILE'])] = open(
+                self.files[int(row['FILE'])], 'rb')
+        data.seek(int(row['OFFSET']))
+        counts = np.frombuffer(data.read(2*int(row['N'])), dtype='<i2')
+        V = self._scale[int(row['CH'])]*counts
+        V.flags.writeable = False
+        return V
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._cache), 'bytes': self._cache.nbytes,
+                    'max_bytes': self._cache.max_bytes, 'hits': self.hits,
+                    'misses': self.misses}
+
+    def close(self):
+        """Close the files and drop the cache"""
+        with self._io_lock:
+            for data in self._handles.values():
+                data.close()
+            self._handles = {}
+        with self._lock:
+            self._cache.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
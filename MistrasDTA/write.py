@@ -0,0 +1,377 @@
+import heapq
+import struct
+
+from .MistrasDTA import (TIME, CHID_byte_len, CHID_to_str, _amp_scale_factor,
+                         _bytes_to_RTOT, _iter_frames, _read_config,
+                         _td_cids)
+
+# numpy is only needed to encode tables; subset_dta() copies raw messages
+
+# Bytes of the body of data messages up to and including the time and CID
+_DATA_MIDS = {1: 7, 2: 6, 3: 6, 173: 8}
+
+
+def _message(MID, payload):
+    """Frame a message: LEN(u16) + MID + payload"""
+    return struct.pack('<HB', len(payload) + 1, MID) + payload
+
+
+def _RTOT_to_bytes(t):
+    """Inverse of _bytes_to_RTOT: seconds to a 6-byte time offset"""
+    ticks = int(round(t/.25e-6))
+    return struct.pack('<IH', ticks & 0xFFFFFFFF, ticks >> 32)
+
+
+def _RTOT_fields(t):
+    """Vectorized _RTOT_to_bytes: low 32 and high 16 bits of the ticks"""
+    import numpy as np
+
+    ticks = np.round(np.asarray(t, dtype=float)/.25e-6).astype(np.int64)
+    return ticks & 0xFFFFFFFF, ticks >> 32
+
+
+def _encode_chid(chid, v, partial_power_segments):
+    """Encode a column of AE characteristic values as stored in MID 1 and 2.
+
+    Returns:
+        (dtype, values): field type of the message layout and the values
+            converted to it
+    """
+    import numpy as np
+
+    if chid == 22:
+        v = np.asarray(v, dtype=np.uint8).reshape(len(v), -1)
+        out = np.zeros((len(v), partial_power_segments), np.uint8)
+        n = min(v.shape[1], partial_power_segments)
+        out[:, :n] = v[:, :n]
+        return (np.uint8, (partial_power_segments,)), out
+    v = np.asarray(v, dtype=float)
+    v = np.where(np.isnan(v), 0, v)  # missing value or NaN
+    if chid == 17:  # RMS
+        return '<u2', np.round(v*5000)
+    if chid == 7:  # RMS8
+        return 'u1', np.round(v*20)
+    if chid == 5:  # DURATION
+        return '<i4', np.trunc(v)
+    if chid == 20:  # SIG STRENGTH
+        return '<i4', np.round(v/3.05)
+    if chid == 21:  # ABS-ENERGY
+        return '<f4', v/9.31e-4
+    return {1: 'u1', 2: '<u2', 4: '<u4'}[CHID_byte_len[chid]], np.trunc(v)
+
+
+def _frames(MID, fields, n):
+    """Zeroed packed array of n messages with LEN and MID filled in"""
+    import numpy as np
+
+    frames = np.zeros(n, [('LEN', '<u2'), ('MID', 'u1')] + fields)
+    frames['LEN'] = frames.dtype.itemsize - 2
+    frames['MID'] = MID
+    return frames
+
+
+def _split(frames):
+    """Bytes of each message of an array from _frames()"""
+    buf = frames.tobytes()
+    size = frames.dtype.itemsize
+    return [buf[i:i+size] for i in range(0, len(buf), size)]
+
+
+def _setup_messages(config):
+    """Header and setup messages for a config from read_bin or _read_config"""
+    out = []
+
+    if config.get("product_name") is not None:
+        # PVERN, then text with 3 trailing bytes
+        out.append(_message(41, b'\x00' + struct.pack('<H', 0)
+                            + config["product_name"].encode('ascii')
+                            + b'\x00'*3))
+
+    if config.get("user_comment") is not None:
+        out.append(_message(7, config["user_comment"].encode('ascii')
+                            + b'\x00'))
+
+    if config.get("test_start_time") is not None:
+        out.append(_message(99, config["test_start_time"].strftime(
+            '%a %b %d %H:%M:%S %Y\n').encode('ascii') + b'\x00'))
+
+    subids = []
+
+    def sub(SUBID, payload):
+        subids.append(struct.pack('<HB', len(payload) + 1, SUBID) + payload)
+
+    chid_list = config.get("chid_list", ())
+    sub(5, struct.pack('<B', len(chid_list)) + bytes(chid_list))
+
+    demand_chid_list = config.get("demand_chid_list", ())
+    demand_pid_list = config.get("demand_pid_list", ())
+    if demand_chid_list or demand_pid_list:
+        sub(6, struct.pack('<B', len(demand_chid_list))
+            + bytes(demand_chid_list)
+            + struct.pack('<B', len(demand_pid_list))
+            + bytes(demand_pid_list))
+
+    for cid, v in sorted(config.get("threshold", {}).items()):
+        sub(22, struct.pack('<BBB', cid, v, 0))
+    for cid, v in sorted(config.get("gain", {}).items()):
+        sub(23, struct.pack('<BBB', cid, v, 0))
+    for cid, v in sorted(config.get("hdt", {}).items()):
+        sub(24, struct.pack('<BH', cid, v//2))
+    for cid, v in sorted(config.get("hlt", {}).items()):
+        sub(25, struct.pack('<BH', cid, v//2))
+    for cid, v in sorted(config.get("pdt", {}).items()):
+        sub(26, struct.pack('<BH', cid, v))
+    if config.get("sampling_interval_ms") is not None:
+        sub(27, struct.pack('<H', config["sampling_interval_ms"]))
+    if config.get("demand_rate_ms") is not None:
+        sub(102, struct.pack('<H', config["demand_rate_ms"]))
+    if config.get("partial_power_segments"):
+        sub(109, struct.pack('<BH', 0, config["partial_power_segments"]))
+
+    for cid, hw in sorted(_hardware(config).items()):
+        sub(173, struct.pack(
+            '<BBBBBBHBHHHHHhHH', 42, 0, 0, 0, 0, 0, 0, cid, 0, 0,
+            hw['SRATE']//1000, 0, 0, hw['TDLY'], 0, 0))
+
+    # MVERN, then SubID records
+    out.append(_message(42, b'\x00' + struct.pack('<H', 0)
+                        + b''.join(subids)))
+    return out
+
+
+def _hardware(config):
+    """Waveform hardware: dict from _read_config or recarray from read_bin"""
+    hardware = config.get("hardware_cfg")
+    if hardware is None:
+        hardware = {int(r['CH']): {'SRATE': int(r['SRATE']),
+                                   'TDLY': int(r['TDLY'])}
+                    for r in config.get("waveform_hardware", [])}
+    return hardware
+
+
+def _hit_messages(rec, config):
+    """(time, order, message) for each row of a rec table"""
+    import numpy as np
+
+    names = rec.dtype.names
+    chid_list = config["chid_list"]
+    partial_power_segments = config["partial_power_segments"]
+    param_cols = [(int(n[len('PARAM_'):]), n) for n in names
+                  if n.startswith('PARAM_')]
+
+    t = np.asarray(rec[TIME], dtype=float)
+    RTOT_lo, RTOT_hi = _RTOT_fields(t)
+    chids = [_encode_chid(chid, rec[CHID_to_str[chid]],
+                          partial_power_segments) for chid in chid_list]
+    params = np.array([np.asarray(rec[n], dtype=float)
+                       for _, n in param_cols]).reshape(-1, len(rec))
+    present = ~np.isnan(params)
+
+    # Only the parametrics present in a row are written, so rows with the
+    # same parametrics share a layout
+    layouts, layout = np.unique(present.T, axis=0, return_inverse=True)
+    layout = layout.ravel()
+
+    messages = [None]*len(rec)
+    for k, mask in enumerate(layouts):
+        rows = np.flatnonzero(layout == k)
+        pids = [(j, pid) for j, (pid, _) in enumerate(param_cols) if mask[j]]
+        fields = [('RTOT_lo', '<u4'), ('RTOT_hi', '<u2'), ('CID', 'u1')]
+        fields += [('CHID%d' % i, dtype) for i, (dtype, _) in enumerate(chids)]
+        fields += [('PARAM%d' % j, [('PID', 'u1'), ('V', '<u2')])
+                   for j, _ in pids]
+        if pids:
+            fields.append(('trailing', '<u2'))
+
+        frames = _frames(1, fields, len(rows))
+        frames['RTOT_lo'] = RTOT_lo[rows]
+        frames['RTOT_hi'] = RTOT_hi[rows]
+        frames['CID'] = np.asarray(rec['CH'])[rows]
+        for i, (dtype, v) in enumerate(chids):
+            frames['CHID%d' % i] = v[rows]
+        for j, pid in pids:
+            frames['PARAM%d' % j]['PID'] = pid
+            frames['PARAM%d' % j]['V'] = np.trunc(params[j, rows])
+
+        for i, m in zip(rows.tolist(), _split(frames)):
+            messages[i] = m
+    return list(zip(t.tolist(), [0]*len(rec), messages))
+
+
+def _td_messages(td, config):
+    """(time, order, message) for each row of a td table"""
+    import numpy as np
+
+    names = td.dtype.names
+    demand_chid_list = config["demand_chid_list"]
+    partial_power_segments = config["partial_power_segments"]
+    pid_cols = [(int(n[len('PID_'):]), n) for n in names
+                if n.startswith('PID_')]
+    cids = _td_cids(names)
+
+    fields = [('RTOT_lo', '<u4'), ('RTOT_hi', '<u2')]
+    fields += [('PID%d' % pid, [('PID', 'u1'), ('V', '<u2')])
+               for pid, _ in pid_cols]
+    columns = []
+    for cid in cids:
+        fields.append(('CID%d' % cid, 'u1'))
+        for chid in demand_chid_list:
+            name = 'CID%d_%s' % (cid, CHID_to_str.get(
+                chid, 'CHID_%d' % chid))
+            dtype, v = _encode_chid(chid, td[name], partial_power_segments)
+            fields.append((name, dtype))
+            columns.append((name, v))
+
+    t = np.asarray(td[TIME], dtype=float)
+    frames = _frames(2, fields, len(td))
+    frames['RTOT_lo'], frames['RTOT_hi'] = _RTOT_fields(t)
+    for pid, n in pid_cols:
+        v = np.asarray(td[n], dtype=float)
+        frames['PID%d' % pid]['PID'] = pid
+        frames['PID%d' % pid]['V'] = np.trunc(np.where(np.isnan(v), 0, v))
+    for cid in cids:
+        frames['CID%d' % cid] = cid
+    for name, v in columns:
+        frames[name] = v
+    return list(zip(t.tolist(), [1]*len(td), _split(frames)))
+
+
+def _wfm_messages(wfm, config):
+    """(time, order, message) for each row of a wfm table"""
+    import numpy as np
+
+    gain = config["gain"]
+    V = []
+    for i in range(len(wfm)):
+        v = wfm['WAVEFORM'][i]
+        if not isinstance(v, np.ndarray):
+            # Byte strings lose trailing zero bytes when read back
+            v = np.frombuffer(wfm['WAVEFORM'][i:i+1].tobytes(), float)
+        V.append(np.asarray(v))
+
+    t = np.asarray(wfm[TIME], dtype=float)
+    RTOT_lo, RTOT_hi = _RTOT_fields(t)
+    cid = np.asarray(wfm['CH'])
+    scale = np.array([_amp_scale_factor(gain[c]) for c in cid.tolist()])
+
+    # Waveforms of the same length share a layout
+    lengths = np.array([len(v) for v in V])
+    messages = [None]*len(wfm)
+    for N in np.unique(lengths).tolist():
+        rows = np.flatnonzero(lengths == N)
+        frames = _frames(173, [('SUBID', 'u1'), ('RTOT_lo', '<u4'),
+                               ('RTOT_hi', '<u2'), ('CID', 'u1'),
+                               ('ALB', 'u1'), ('counts', '<i2', (N,))],
+                         len(rows))
+        frames['SUBID'] = 1
+        frames['RTOT_lo'] = RTOT_lo[rows]
+        frames['RTOT_hi'] = RTOT_hi[rows]
+        frames['CID'] = cid[rows]
+        counts = np.array([V[i] for i in rows.tolist()]).reshape(len(rows), N)
+        frames['counts'] = np.round(counts/scale[rows, None])
+
+        for i, m in zip(rows.tolist(), _split(frames)):
+            messages[i] = m
+    return list(zip(t.tolist(), [2]*len(wfm), messages))
+
+
+def write_bin(file, config, rec=None, wfm=None, td=None):
+    """Write tables to a .DTA file that read_bin() and AEWin can open.
+
+    Setup messages are generated from config; hits, time-driven samples
+    and waveforms are interleaved by time.  Values are encoded with the
+    inverse of the scaling applied by :func:`read_bin`.
+
+    Args:
+        file (str): output path
+        config (dict): setup as returned by ``read_bin(...,
+            include_config=True)``; for time-driven data it must hold
+            ``demand_chid_list`` and ``demand_pid_list``
+        rec (numpy.recarray): table of acoustic hits
+        wfm (numpy.recarray): table of waveforms (WAVEFORM in volts)
+        td (numpy.recarray): time-driven data
+    """
+    tables = []
+    if rec is not None and len(rec):
+        tables.append(_hit_messages(rec, config))
+    if td is not None and len(td):
+        tables.append(_td_messages(td, config))
+    if wfm is not None and len(wfm):
+        tables.append(_wfm_messages(wfm, config))
+
+    # Interleave by time, keeping the row order within each table
+    messages = list(heapq.merge(*tables, key=lambda m: m[:2]))
+
+    with open(file, 'wb') as f:
+        for m in _setup_messages(config):
+            f.write(m)
+
+        # Start and stop of test around the data
+        f.write(_message(128, _RTOT_to_bytes(0) + b'\x01'))
+        for _, _, m in messages:
+            f.write(m)
+        t_end = messages[-1][0] if messages else 0
+        f.write(_message(129, _RTOT_to_bytes(t_end) + b'\x01'))
+
+
+def subset_dta(src, dst, channels=None, time_range=None,
+               drop_waveforms=False):
+    """Copy a subset of a .DTA file without decoding it.
+
+    The header and setup messages are copied as they are, and each data
+    message is copied byte for byte if it matches the filters.  Messages
+    without a channel or time (test start/stop, resets) are always kept.
+
+    Args:
+        src (str): input .DTA file
+        dst (str): output .DTA file
+        channels (iterable): keep hits and waveforms of these channels only;
+            time-driven messages hold all channels and are kept whole
+        time_range (tuple): ``(t0, t1)`` in seconds of RTOT; data messages
+            outside ``t0 <= t < t1`` are dropped
+        drop_waveforms (bool): drop all waveform messages if True
+    Returns:
+        counts (dict): number of messages kept and dropped
+    """
+    channels = None if channels is None else set(channels)
+    t0, t1 = time_range if time_range is not None else (None, None)
+    counts = {'kept': 0, 'dropped': 0}
+
+    with open(src, 'rb', buffering=1 << 20) as data, \
+            open(dst, 'wb', buffering=1 << 20) as out:
+        config = _read_config(data)
+        header_end = data.tell()
+        data.seek(0)
+        out.write(data.read(header_end))
+
+        for offset, MID, body in _iter_frames(data):
+            keep = not (MID == 173 and drop_waveforms)
+            # Messages too short to hold a time and CID are copied as-is
+            if keep and len(body) >= _DATA_MIDS.get(MID, len(body) + 1):
+                if MID == 173:
+                    t, cid = _bytes_to_RTOT(body[1:7]), body[7]
+                else:
+                    t = _bytes_to_RTOT(body[0:6])
+                    cid = body[6] if MID == 1 else None
+                if channels is not None and cid is not None \
+                        and cid not in channels:
+                    keep = False
+                if (t0 is not None and t < t0) or \
+                        (t1 is not None and t >= t1):
+                    keep = False
+
+            if keep:
+                if MID == 8:
+                    # LEN of MID 8 spans the setup messages that follow it
+                    pos = data.tell()
+                    data.seek(offset)
+                    out.write(data.read(2))
+                    data.seek(pos)
+                else:
+                    out.write(struct.pack('<H', len(body) + 1))
+                out.write(struct.pack('<B', MID))
+                out.write(body)
+                counts['kept'] += 1
+            else:
+                counts['dropped'] += 1
+    return counts
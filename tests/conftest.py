@@ -48,6 +48,13 @@ def cont_files(dta_dir):
     return sorted(glob.glob(osp.join(dta_dir, '*__*.DTA')))
 
 
+@pytest.fixture
+def chain_files(dta_dir, cont_files):
+    """First file of the recording with continuation files, followed by
+    the continuation files, as passed to read_bin()."""
+    return [osp.join(dta_dir, '260114-4ch-1para.DTA')] + cont_files
+
+
 def pytest_generate_tests(metafunc):
     """Parametrize tests that request ``dta_stem`` over every standalone
     .DTA file discovered in ``--dtaDir`` (continuation files excluded)."""
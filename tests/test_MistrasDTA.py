@@ -87,3 +87,180 @@ def test_iter_bin(dta_file, ref_file):
     # Verify first hit's channel matches reference
     if hits and hasattr(rec_ref, 'dtype'):
         assert hits[0][1] == rec_ref["CH"][0]  # cid is second element
+
+
+def _data_message_offsets(path):
+    """Offsets of hit, time-driven and waveform messages in a .DTA file"""
+    import struct
+    with open(path, 'rb') as f:
+        b = f.read()
+    pos, offsets = 0, []
+    while pos < len(b):
+        [LEN, MID] = struct.unpack_from('<HB', b, pos)
+        if MID in (1, 2, 3, 173):
+            offsets.append(pos)
+        pos += 11 if MID == 8 else 2 + LEN
+    return b, offsets
+
+
+def test_resync_clean(dta_file):
+    """resync=True yields the same events and reports nothing on clean
+    files."""
+    report = []
+    events = list(MistrasDTA.iter_bin(dta_file, resync=True, report=report))
+    assert report == []
+    assert len(events) == len(list(MistrasDTA.iter_bin(dta_file)))
+
+
+def test_resync_corrupt(dta_file, tmp_path):
+    """Corrupt messages are skipped and truncated files end cleanly."""
+    b, offsets = _data_message_offsets(dta_file)
+    n_events = len(list(MistrasDTA.iter_bin(dta_file)))
+
+    # Turn a time-driven message into a hit of the wrong length, then cut
+    # the file inside the last message
+    bad = bytearray(b)
+    bad[offsets[10]+2] = 1
+    bad = bad[:offsets[-1] + 5]
+    path = tmp_path / 'corrupt.DTA'
+    path.write_bytes(bytes(bad))
+
+    report = []
+    events = list(MistrasDTA.iter_bin(str(path), resync=True, report=report))
+
+    assert len(events) == n_events - 2
+    assert report[0].start == offsets[10]
+    assert report[0].end == offsets[11]
+    assert report[-1].reason == "truncated message"
+    assert report[-1].end == len(bad)
+
+
+def test_resync_corrupt_length(dta_file, tmp_path):
+    """A corrupt LEN field is reported instead of shifting the framing."""
+    import struct
+    b, offsets = _data_message_offsets(dta_file)
+    n_events = len(list(MistrasDTA.iter_bin(dta_file)))
+
+    for LEN in (40, 1000, 0x1234, 0xbeef):
+        bad = bytearray(b)
+        struct.pack_into('<H', bad, offsets[10], LEN)
+        path = tmp_path / 'corrupt.DTA'
+        path.write_bytes(bytes(bad))
+
+        report = []
+        events = list(MistrasDTA.iter_bin(str(path), resync=True,
+                                          report=report))
+        assert len(events) == n_events - 1
+        assert report[0].start == offsets[10]
+        assert report[0].end == offsets[11]
+
+
+def test_resync_garbage(dta_file, tmp_path):
+    """Random bytes overwriting messages only lose those messages."""
+    import random
+    b, offsets = _data_message_offsets(dta_file)
+    n_events = len(list(MistrasDTA.iter_bin(dta_file)))
+
+    start = offsets[len(offsets)//2] + 9
+    end = start + 150
+    bad = bytearray(b)
+    rng = random.Random(0)
+    bad[start:end] = bytes(rng.randrange(256) for _ in range(end - start))
+    path = tmp_path / 'garbage.DTA'
+    path.write_bytes(bytes(bad))
+
+    report = []
+    events = list(MistrasDTA.iter_bin(str(path), resync=True, report=report))
+    # Data messages overlapping the garbage
+    lost = sum(o < end and nxt > start
+               for o, nxt in zip(offsets, offsets[1:]))
+    assert report
+    assert start - 9 <= report[0].start < end
+    assert n_events - lost <= len(events) < n_events
+
+
+def test_partial_power(chain_files):
+    """Partial power is a uint8 subarray field and rec is plain old data."""
+    files = chain_files
+    rec, wfm, config = MistrasDTA.read_bin(files, include_config=True)
+    n = config["partial_power_segments"]
+
+    assert rec.dtype['PARTIAL POWER'] == np.dtype((np.uint8, (n,)))
+    assert not any(rec.dtype[c].hasobject for c in rec.dtype.names)
+
+    hits = [d for t, d in MistrasDTA.iter_bin(files, skip_wfm=True)
+            if t is MistrasDTA.EventType.HIT]
+    i = config["chid_list"].index(22) + 2
+    np.testing.assert_array_equal(
+        rec['PARTIAL POWER'],
+        [np.frombuffer(h[i].ljust(n, b'\x00'), np.uint8) for h in hits])
+
+    # Segments are views into the table
+    segment = rec['PARTIAL POWER'][:, 1]
+    assert np.shares_memory(segment, rec)
+
+
+def _events(files, **kwargs):
+    return [(t, [v.tobytes() if hasattr(v, 'tobytes') else v for v in d])
+            for t, d in MistrasDTA.iter_bin(files, **kwargs)]
+
+
+def test_prefetch(dta_file, chain_files):
+    """Reading ahead in blocks yields the same events, including messages
+    spanning block boundaries and continuation files."""
+    for files in (dta_file, chain_files):
+        events = _events(files)
+        for block_size in (509, 4096):
+            assert _events(files, prefetch=block_size,
+                           queue_depth=2) == events
+        assert _events(files, prefetch=4096, resync=True) == events
+
+
+def test_prefetch_resync(dta_file, tmp_path):
+    """Resynchronizing seeks work on a prefetching reader."""
+    b, offsets = _data_message_offsets(dta_file)
+    bad = bytearray(b)
+    bad[offsets[10]+2] = 1
+    path = tmp_path / 'corrupt.DTA'
+    path.write_bytes(bytes(bad))
+
+    report, report_prefetch = [], []
+    events = _events(str(path), resync=True, report=report)
+    assert _events(str(path), resync=True, report=report_prefetch,
+                   prefetch=512) == events
+    assert report_prefetch == report
+
+
+def test_missing_values_are_nan(chain_files, tmp_path):
+    """Parametric and time-driven columns with gaps are float with NaN."""
+    import struct
+    files = chain_files
+    rec, _ = MistrasDTA.read_bin(files, skip_wfm=True)
+
+    hits = [d for t, d in MistrasDTA.iter_bin(files, skip_wfm=True)
+            if t is MistrasDTA.EventType.HIT]
+    param = [h[-1] for h in hits]
+    assert None in param
+    assert rec['PARAM_92'].dtype == float
+    np.testing.assert_array_equal(
+        rec['PARAM_92'], [np.nan if v is None else v for v in param])
+
+    # Drop the last channel block of the second time-driven message
+    b, offsets = _data_message_offsets(files[0])
+    _, _, td = MistrasDTA.read_bin(files[0], include_td=True)
+    fv_len = 1 + 2 + 4  # ASL, RMS, ABS-ENERGY
+    o = [o for o in offsets if b[o+2] == 2][1]
+    [LEN] = struct.unpack_from('<H', b, o)
+    cut = o + 2 + LEN - (1 + fv_len)
+    data = (b[:o] + struct.pack('<H', LEN - 1 - fv_len) + b[o+2:cut]
+            + b[o+2+LEN:])
+    path = tmp_path / 'gap.DTA'
+    path.write_bytes(data)
+
+    _, _, td2 = MistrasDTA.read_bin(str(path), include_td=True)
+    assert td.dtype['CID4_ASL'] == np.int64
+    for name in ('CID4_ASL', 'CID4_RMS', 'CID4_ABS-ENERGY'):
+        assert td2.dtype[name] == float
+        assert np.isnan(td2[name][1])
+        np.testing.assert_array_equal(np.delete(td2[name], 1),
+                                      np.delete(td[name], 1))
@@ -0,0 +1,97 @@
+import numpy as np
+import MistrasDTA
+from MistrasDTA.aggregate import Aggregator, aggregate
+
+SPECS = [(None, 'count'), ('ENER', 'sum'), ('AMP', 'min'), ('AMP', 'max'),
+         ('AMP', 'mean'), ('AMP', 'hist')]
+
+
+def test_iter_chunks(dta_file):
+    """iter_chunks() yields the same rows as read_bin()."""
+    rec, wfm, td = MistrasDTA.read_bin(dta_file, include_td=True)
+    chunks = {}
+    for ev_type, chunk in MistrasDTA.iter_chunks(dta_file, chunk_size=100,
+                                                 include_td=True):
+        assert len(chunk) <= 100
+        chunks.setdefault(ev_type, []).append(chunk)
+
+    for ev_type, table in ((MistrasDTA.EventType.HIT, rec),
+                           (MistrasDTA.EventType.TIME_DRIVEN, td),
+                           (MistrasDTA.EventType.WAVEFORM, wfm)):
+        if not hasattr(table, 'dtype'):
+            assert ev_type not in chunks
+            continue
+        joined = np.concatenate(chunks[ev_type])
+        for name in joined.dtype.names:
+            np.testing.assert_array_equal(joined[name], table[name])
+
+
+def test_iter_chunks_max_delay(dta_file, monkeypatch):
+    """Partial chunks are yielded once their oldest event is too old."""
+    import itertools
+    import time
+    # One tick per event read
+    clock = itertools.count()
+    monkeypatch.setattr(time, 'perf_counter', lambda: next(clock))
+
+    rec, _ = MistrasDTA.read_bin(dta_file, skip_wfm=True)
+    read_times = []
+    chunks = list(MistrasDTA.iter_chunks(dta_file, chunk_size=1000,
+                                         skip_wfm=True, max_delay=5,
+                                         read_times=read_times))
+    assert len(read_times) == len(chunks)
+    assert all(len(chunk) <= 6 for _, chunk in chunks)
+
+    hits = [c for t, c in chunks if t is MistrasDTA.EventType.HIT]
+    if hits:
+        np.testing.assert_array_equal(np.concatenate(hits)['CH'], rec['CH'])
+
+
+def test_aggregate_hits(chain_files):
+    """Hit aggregation matches reductions computed on read_bin() output."""
+    files = chain_files
+    rec, _ = MistrasDTA.read_bin(files, skip_wfm=True)
+
+    out = aggregate(files, SPECS, bucket=0.5, chunk_size=50).result()
+    assert out['COUNT'].sum() == len(rec)
+
+    for row in out:
+        sel = ((rec['CH'] == row['CH'])
+               & (np.floor(rec['SSSSSSSS.mmmuuun']/0.5)*0.5 == row['BUCKET']))
+        assert row['COUNT'] == sel.sum()
+        assert np.isclose(row['ENER_sum'], rec['ENER'][sel].sum())
+        assert row['AMP_min'] == rec['AMP'][sel].min()
+        assert row['AMP_max'] == rec['AMP'][sel].max()
+        assert np.isclose(row['AMP_mean'], rec['AMP'][sel].mean())
+        hist, _ = np.histogram(rec['AMP'][sel], bins=np.arange(0, 101))
+        np.testing.assert_array_equal(row['AMP_hist'], hist)
+
+
+def test_aggregate_merge(dta_file):
+    """Merging per-chunk aggregators gives the single-pass result."""
+    single = aggregate(dta_file, SPECS, bucket=10.0).result()
+
+    merged = Aggregator(SPECS, bucket=10.0)
+    for ev_type, chunk in MistrasDTA.iter_chunks(dta_file, chunk_size=3,
+                                                 skip_wfm=True):
+        part = Aggregator(SPECS, bucket=10.0)
+        part.update(chunk)
+        merged.merge(part)
+
+    np.testing.assert_array_equal(merged.result(), single)
+
+
+def test_aggregate_td(dta_file):
+    """Time-driven features are aggregated per CID."""
+    _, _, td = MistrasDTA.read_bin(dta_file, include_td=True)
+    out = aggregate(dta_file, [('RMS', 'max')], bucket=60.0,
+                    event_type=MistrasDTA.EventType.TIME_DRIVEN).result()
+    names = [n for n in getattr(td, 'dtype', np.dtype([])).names or ()
+             if n.endswith('_RMS')]
+    if not names:
+        assert len(out) == 0
+        return
+    for name in names:
+        cid = int(name[3:name.index('_')])
+        np.testing.assert_allclose(out['RMS_max'][out['CH'] == cid].max(),
+                                   td[name].max())
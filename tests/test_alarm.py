@@ -0,0 +1,84 @@
+import numpy as np
+import MistrasDTA
+from MistrasDTA.alarm import Rule, evaluate, rules_from_config
+
+
+def _expected(rec, rule):
+    """Brute-force rising edges of a rule, per channel"""
+    alarms = []
+    for c in np.unique(rec['CH']):
+        hits = np.sort(rec[rec['CH'] == c], order='SSSSSSSS.mmmuuun',
+                       kind='stable')
+        t = hits['SSSSSSSS.mmmuuun']
+        active = False
+        for i in range(len(hits)):
+            if rule.metric == 'amp':
+                value = hits['AMP'][i]
+            else:
+                inside = (t > t[i] - rule.window) & (t <= t[i])
+                inside[i+1:] = False
+                weight = 1 if rule.metric == 'hit_rate' else hits['ENER']
+                value = np.sum(np.ones(len(t))*weight*inside)/rule.window
+            if value > rule.limit and not active:
+                alarms.append((rule.name, int(c), t[i]))
+            active = value > rule.limit
+    return sorted(alarms)
+
+
+def test_alarms_match_brute_force(chain_files):
+    """Chunked sliding-window evaluation matches a per-hit loop."""
+    files = chain_files
+    rec, _ = MistrasDTA.read_bin(files, skip_wfm=True)
+
+    rules = [Rule('rate', 'hit_rate', 20, window=0.5),
+             Rule('energy', 'energy_rate', 2000, window=0.25),
+             Rule('amp', 'amp', 80, channels=(1, 2))]
+    raised = []
+    engine = evaluate(files, rules, raised.append, chunk_size=7)
+
+    got = sorted((a.rule.name, a.CH, a.time) for a in raised)
+    expected = []
+    for rule in rules[:2]:
+        expected += _expected(rec, rule)
+    expected += _expected(rec[np.isin(rec['CH'], (1, 2))], rules[2])
+    assert len(got) > 0
+    assert got == sorted(expected)
+
+    assert engine.n_alarms == len(raised)
+    assert all(a.latency is not None and a.latency >= 0 for a in raised)
+    assert engine.max_latency >= engine.mean_latency
+
+
+def test_alarm_latency(chain_files):
+    """Latency counts from reading the hit, and max_delay bounds how long
+    a hit waits for its chunk."""
+    import time
+    files = chain_files
+    rules = [Rule('amp', 'amp', 80)]
+
+    start = time.perf_counter()
+    raised = []
+    evaluate(files, rules, raised.append, chunk_size=1 << 20)
+    elapsed = time.perf_counter() - start
+    # One chunk: every alarm waited for all hits to be read
+    assert all(0 < a.latency <= elapsed for a in raised)
+
+    delayed = []
+    evaluate(files, rules, delayed.append, chunk_size=1 << 20, max_delay=0)
+    assert sorted((a.CH, a.time) for a in delayed) == \
+        sorted((a.CH, a.time) for a in raised)
+    assert max(a.latency for a in delayed) < min(a.latency for a in raised)
+
+
+def test_rules_from_config(dta_file):
+    """Config thresholds and timing become per-channel rules."""
+    _, _, config = MistrasDTA.read_bin(dta_file, skip_wfm=True,
+                                       include_config=True)
+    rules = rules_from_config(config, amp_margin=10, saturation=0.5)
+    for ch, threshold in config["threshold"].items():
+        amp = [r for r in rules if r.metric == 'amp' and r.channels == (ch,)]
+        assert amp[0].limit == threshold + 10
+        rate = [r for r in rules
+                if r.metric == 'hit_rate' and r.channels == (ch,)]
+        dead_time = config["hdt"][ch] + config["hlt"][ch]
+        assert np.isclose(rate[0].limit, 0.5e6/dead_time)
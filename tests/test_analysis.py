@@ -0,0 +1,55 @@
+import numpy as np
+import MistrasDTA
+from MistrasDTA.analysis import (MiniBatchKMeans, add_columns, cluster,
+                                 features)
+
+
+def test_features(chain_files):
+    """Vectorized RA and AF match a per-hit computation."""
+    rec, _ = MistrasDTA.read_bin(chain_files, skip_wfm=True)
+    X = features(rec)
+
+    for row, (ra, af) in zip(rec, X):
+        amp = 1e-6*10**(row['AMP']/20)
+        assert np.isclose(ra, row['RISE']*1e-3/amp)
+        if row['DURATION'] > 0:
+            assert np.isclose(af, 1e3*row['COUN']/row['DURATION'])
+        else:
+            assert np.isnan(af)
+
+    out = add_columns(rec, {'RA': X[:, 0], 'AF': X[:, 1]})
+    np.testing.assert_array_equal(out['AMP'], rec['AMP'])
+    np.testing.assert_array_equal(out['RA'], X[:, 0])
+
+
+def test_minibatch_kmeans():
+    """Well separated groups are recovered from small batches."""
+    rng = np.random.default_rng(0)
+    true = np.array([[0, 0], [10, 0], [0, 10]])
+    group = rng.integers(3, size=3000)
+    x = true[group] + rng.normal(scale=0.5, size=(3000, 2))
+    table = np.rec.fromarrays([x[:, 0], x[:, 1]], names=['A', 'B'])
+
+    model = MiniBatchKMeans(3, names=('A', 'B'), batch_size=50, seed=1)
+    for start in range(0, len(table), 200):
+        model.partial_fit(table[start:start+200])
+
+    order = np.argsort(model.cluster_centers[:, 0]
+                       + 2*model.cluster_centers[:, 1])
+    np.testing.assert_allclose(model.cluster_centers[order], true, atol=0.1)
+
+    labels = model.predict(table)
+    # Same grouping as the generating labels, up to a permutation
+    assert len(set(zip(labels, group))) == 3
+
+
+def test_cluster(chain_files):
+    """Streamed labels are aligned with the rec table."""
+    files = chain_files
+    rec, _ = MistrasDTA.read_bin(files, skip_wfm=True)
+
+    model, labels = cluster(files, 3, chunk_size=50, n_epochs=2, seed=0)
+    assert len(labels) == len(rec)
+    np.testing.assert_array_equal(labels, model.predict(rec))
+    assert set(labels) <= {-1, 0, 1, 2}
+    assert model.counts.sum() > 0
@@ -0,0 +1,43 @@
+import subprocess
+import sys
+
+
+def _run(code):
+    """Run code in a fresh interpreter with -X importtime; returns the names
+    of imported modules and the cumulative import time of MistrasDTA in µs"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            capture_output=True, text=True, check=True)
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = int(cumulative)
+    return modules
+
+
+def test_import_without_numpy():
+    """Importing the package does not import numpy."""
+    modules = _run('import MistrasDTA')
+    assert not any(m.split('.')[0] == 'numpy' for m in modules)
+
+    # Importing the package costs less than importing numpy alone
+    numpy = _run('import numpy')
+    assert modules['MistrasDTA'] < numpy['numpy']
+
+
+def test_stream_without_numpy(dta_file):
+    """Header parsing and streaming without waveforms do not import numpy."""
+    modules = _run(
+        'import MistrasDTA\n'
+        'for _ in MistrasDTA.iter_bin(%r, skip_wfm=True): pass' % dta_file)
+    assert not any(m.split('.')[0] == 'numpy' for m in modules)
+
+
+def test_lazy_submodules():
+    """Submodules that need numpy load on first attribute access."""
+    subprocess.run([sys.executable, '-c',
+                    'import sys, MistrasDTA\n'
+                    'assert "numpy" not in sys.modules\n'
+                    'MistrasDTA.aggregate.Aggregator\n'
+                    'assert "numpy" in sys.modules'], check=True)
@@ -0,0 +1,111 @@
+import io
+import json
+import os.path as osp
+import threading
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+import MistrasDTA
+from MistrasDTA.serve import QueryServer
+
+
+@pytest.fixture
+def server(dta_dir):
+    server = QueryServer(dta_dir, ('127.0.0.1', 0))
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,),
+                              daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _get(server, path):
+    host, port = server.server_address[:2]
+    url = 'http://%s:%d%s' % (host, port, path)
+    with urllib.request.urlopen(url) as response:
+        return response.read()
+
+
+def test_query_hits(server, dta_file):
+    """Range and channel queries match filtering read_bin() output."""
+    rec, _ = MistrasDTA.read_bin(dta_file, skip_wfm=True)
+    name = osp.basename(dta_file)
+
+    out = np.load(io.BytesIO(_get(server, '/hits?file=' + name)))
+    if not hasattr(rec, 'dtype'):
+        assert len(out) == 0
+        return
+    assert len(out) == len(rec)
+
+    t = np.sort(rec['SSSSSSSS.mmmuuun'])
+    t0, t1 = float(t[len(t)//4]), float(t[3*len(t)//4])
+    ch = rec['CH'][0]
+    out = np.load(io.BytesIO(_get(
+        server, '/hits?file=%s&t0=%r&t1=%r&ch=%d&cols=AMP' % (
+            name, t0, t1, ch))))
+    sel = ((rec['SSSSSSSS.mmmuuun'] >= t0) & (rec['SSSSSSSS.mmmuuun'] < t1)
+           & (rec['CH'] == ch))
+    assert out.dtype.names == ('SSSSSSSS.mmmuuun', 'AMP')
+    np.testing.assert_array_equal(np.sort(out['AMP']),
+                                  np.sort(rec['AMP'][sel]))
+
+
+def test_cache_and_metrics(server, dta_file):
+    """Repeated queries hit the cache and are recorded in /metrics."""
+    name = osp.basename(dta_file)
+    _get(server, '/td?file=' + name)
+    _get(server, '/td?file=' + name)
+
+    metrics = json.loads(_get(server, '/metrics'))
+    assert metrics['cache']['misses'] == 1
+    assert metrics['cache']['hits'] == 1
+    assert metrics['latency']['/td']['count'] == 2
+
+
+def test_outside_root(server):
+    """Files outside the served directory are refused."""
+    with pytest.raises(urllib.error.HTTPError) as e:
+        _get(server, '/hits?file=../test_serve.py')
+    assert e.value.code == 400
+
+
+def _get_error(server, path):
+    with pytest.raises(urllib.error.HTTPError) as e:
+        _get(server, path)
+    return e.value.code, json.loads(e.value.read())['error']
+
+
+def test_continuation_chain(server, chain_files, cont_files):
+    """Repeated file parameters serve a chain of continuation files."""
+    files = chain_files
+    rec, _ = MistrasDTA.read_bin(files, skip_wfm=True)
+
+    query = '&'.join('file=' + osp.basename(f) for f in files)
+    out = np.load(io.BytesIO(_get(server, '/hits?' + query)))
+    np.testing.assert_array_equal(np.sort(out['SSSSSSSS.mmmuuun']),
+                                  np.sort(rec['SSSSSSSS.mmmuuun']))
+
+    # A continuation file cannot be decoded on its own
+    code, message = _get_error(
+        server, '/hits?file=' + osp.basename(cont_files[0]))
+    assert code == 422
+    assert message.startswith('cannot decode file')
+
+
+def test_errors(server, dta_file):
+    """Bad requests get a JSON error and are recorded in /metrics."""
+    name = osp.basename(dta_file)
+    code, message = _get_error(server, '/td?file=' + name + '&cols=FOO')
+    assert (code, message) == (400, 'unknown columns: FOO')
+
+    code, message = _get_error(server, '/td?file=.')
+    assert code == 400
+
+    code, _ = _get_error(server, '/td?file=missing.DTA')
+    assert code == 404
+
+    metrics = json.loads(_get(server, '/metrics'))
+    assert metrics['latency']['/td']['count'] == 3
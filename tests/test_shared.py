@@ -0,0 +1,115 @@
+import multiprocessing
+
+import numpy as np
+import pytest
+import MistrasDTA
+from MistrasDTA import shared
+
+
+def _count_hits(name, queue):
+    with shared.attach(name) as view:
+        view.wait(timeout=10)
+        queue.put(sum(len(c) for c in view['rec']))
+
+
+def _publish_paused(dta_file, name, started, resume, done):
+    """Publish hits in chunks, pausing after the first chunk"""
+    iter_chunks = shared.iter_chunks
+
+    def paused(*args, **kwargs):
+        for i, item in enumerate(iter_chunks(*args, **kwargs)):
+            yield item
+            if i == 0:
+                started.set()
+                resume.wait(30)
+
+    shared.iter_chunks = paused
+    publisher = shared.publish(dta_file, name=name, chunk_size=3,
+                               skip_wfm=True, include_td=False)
+    done.wait(30)
+    publisher.unlink()
+
+
+def _assert_tables_equal(view, rec, wfm, td):
+    for table, ref in (('rec', rec), ('wfm', wfm), ('td', td)):
+        if not hasattr(ref, 'dtype'):
+            assert view[table] == []
+            continue
+        [chunk] = view[table]
+        for name in chunk.dtype.names:
+            np.testing.assert_array_equal(chunk[name], ref[name])
+
+
+def test_publish_attach(dta_file):
+    """Attached tables match read_bin() output."""
+    rec, wfm, td = MistrasDTA.read_bin(dta_file, include_td=True)
+
+    with shared.publish(dta_file) as publisher:
+        with shared.attach(publisher.name) as view:
+            assert view.complete
+            assert view.config["chid_list"] == publisher.descriptor[
+                "config"]["chid_list"]
+            _assert_tables_equal(view, rec, wfm, td)
+
+
+def test_publish_chunks_other_process(dta_file):
+    """Chunked publications are visible from another process."""
+    rec, _ = MistrasDTA.read_bin(dta_file, skip_wfm=True)
+
+    with shared.publish(dta_file, chunk_size=3, skip_wfm=True,
+                        include_td=False) as publisher:
+        queue = multiprocessing.Queue()
+        p = multiprocessing.Process(target=_count_hits,
+                                    args=(publisher.name, queue))
+        p.start()
+        n = queue.get(timeout=30)
+        p.join()
+
+    assert n == len(rec)
+
+
+def test_publish_in_progress(dta_file):
+    """Chunks are consumed while the publishing process is still decoding."""
+    rec, _ = MistrasDTA.read_bin(dta_file, skip_wfm=True)
+    if len(rec) < 4:
+        pytest.skip("needs hits in more than one chunk")
+
+    ctx = multiprocessing.get_context('spawn')
+    started, resume, done = ctx.Event(), ctx.Event(), ctx.Event()
+    name = 'mistrasdta_test_%d' % id(started)
+    p = ctx.Process(target=_publish_paused,
+                    args=(dta_file, name, started, resume, done))
+    p.start()
+    try:
+        assert started.wait(30)
+        view = shared.attach(name)
+        assert not view.complete
+        n_first = sum(len(c) for c in view['rec'])
+        assert 0 < n_first < len(rec)
+
+        resume.set()
+        assert view.wait(timeout=30)
+        hits = np.concatenate(view['rec'])
+        np.testing.assert_array_equal(hits['CH'], rec['CH'])
+        view.close()
+    finally:
+        resume.set()
+        done.set()
+        p.join(30)
+    assert p.exitcode == 0
+
+
+def test_close_with_live_chunk(dta_file):
+    """Closing a view while a chunk is referenced raises instead of
+    unmapping memory in use."""
+    with shared.publish(dta_file, skip_wfm=True) as publisher:
+        view = shared.attach(publisher.name)
+        if not view['td'] and not view['rec']:
+            view.close()
+            pytest.skip("no tables published")
+        chunk = (view['rec'] or view['td'])[0]
+        with pytest.raises(BufferError):
+            view.close()
+        assert len(chunk[chunk.dtype.names[0]]) == len(chunk)
+        del chunk
+        view.close()
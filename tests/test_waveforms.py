@@ -0,0 +1,49 @@
+import numpy as np
+import MistrasDTA
+from MistrasDTA.waveforms import WaveformStore
+
+
+def test_waveform_store(dta_file):
+    """Waveforms decoded on demand match read_bin() and get_waveform_data()."""
+    rec, wfm = MistrasDTA.read_bin(dta_file)
+    with WaveformStore(dta_file) as store:
+        assert len(store) == len(wfm)
+        if not len(wfm):
+            return
+        for name in ('SSSSSSSS.mmmuuun', 'CH', 'SRATE', 'TDLY'):
+            np.testing.assert_array_equal(store.index[name], wfm[name])
+
+        indices = list(range(len(wfm)))[::-1]
+        for i, (t, V) in zip(indices, store.get_many(indices)):
+            # Trailing zero samples are lost in the byte strings of wfm
+            t_ref, V_ref = MistrasDTA.get_waveform_data(wfm[i])
+            np.testing.assert_array_equal(t[:len(t_ref)], t_ref)
+            np.testing.assert_array_equal(V[:len(V_ref)], V_ref)
+            assert not np.any(V[len(V_ref):])
+
+
+def test_waveform_cache(chain_files):
+    """The cache stays within its byte bound and time axes are shared."""
+    files = chain_files
+    with WaveformStore(files) as full:
+        size = full[0][1].nbytes
+        last = full[-1][1]
+
+    store = WaveformStore(files, max_bytes=3*size)
+    first = store.get_many([0, 1, 2, 3, 4])
+    assert store.stats()['bytes'] <= 3*size
+    assert store.stats()['misses'] == 5
+
+    # Recent waveforms are served from the cache
+    assert store[4][1] is first[4][1]
+    assert store.stats()['hits'] == 1
+    store[0]
+    assert store.stats()['misses'] == 6
+
+    assert first[0][0] is first[1][0]
+    np.testing.assert_array_equal(store[len(store) - 1][1], last)
+
+    # Cache hits do not wait for reads in progress
+    with store._io_lock:
+        assert store[len(store) - 1][1] is not None
+    store.close()
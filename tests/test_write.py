@@ -0,0 +1,75 @@
+import numpy as np
+import MistrasDTA
+from MistrasDTA.write import subset_dta, write_bin
+
+
+def _assert_tables_equal(a, b):
+    if not hasattr(a, 'dtype'):
+        assert not hasattr(b, 'dtype') or len(b) == 0
+        return
+    assert a.dtype.names == b.dtype.names
+    for name in a.dtype.names:
+        if name != 'TIMESTAMP':
+            np.testing.assert_array_equal(a[name], b[name])
+
+
+def test_write_roundtrip(chain_files, tmp_path):
+    """Tables written by write_bin() read back unchanged."""
+    files = chain_files
+    rec, wfm, td, config = MistrasDTA.read_bin(
+        files, include_td=True, include_config=True)
+
+    path = str(tmp_path / 'written.DTA')
+    write_bin(path, config, rec=rec, wfm=wfm, td=td)
+    rec2, wfm2, td2, config2 = MistrasDTA.read_bin(
+        path, include_td=True, include_config=True)
+
+    for key in config:
+        if key != "waveform_hardware":
+            assert config2[key] == config[key]
+    _assert_tables_equal(rec, rec2)
+    _assert_tables_equal(wfm, wfm2)
+    _assert_tables_equal(td, td2)
+
+
+def test_subset_copy(dta_file, tmp_path):
+    """Without filters the subset is a byte-for-byte copy."""
+    path = tmp_path / 'copy.DTA'
+    subset_dta(dta_file, str(path))
+    with open(dta_file, 'rb') as f:
+        assert path.read_bytes() == f.read()
+
+
+def test_subset_filters(dta_file, tmp_path):
+    """Channel, time and waveform filters match filtering read_bin()."""
+    rec, wfm, td = MistrasDTA.read_bin(dta_file, include_td=True)
+    t = td['SSSSSSSS.mmmuuun']
+    t0, t1 = float(t[len(t)//4]), float(t[len(t)//2])
+
+    path = str(tmp_path / 'subset.DTA')
+    subset_dta(dta_file, path, time_range=(t0, t1), drop_waveforms=True)
+    rec2, wfm2, td2 = MistrasDTA.read_bin(path, include_td=True)
+
+    assert len(wfm2) == 0
+    _assert_tables_equal(td[(t >= t0) & (t < t1)], td2)
+    if hasattr(rec, 'dtype'):
+        t = rec['SSSSSSSS.mmmuuun']
+        _assert_tables_equal(rec[(t >= t0) & (t < t1)], rec2)
+
+    if hasattr(wfm, 'dtype'):
+        ch = wfm['CH'][0]
+        subset_dta(dta_file, path, channels=[ch])
+        _, wfm3 = MistrasDTA.read_bin(path)
+        _assert_tables_equal(wfm[wfm['CH'] == ch], wfm3)
+
+
+def test_subset_short_message(dta_file, tmp_path):
+    """Data messages too short for a time and CID are copied unchanged."""
+    with open(dta_file, 'rb') as f:
+        data = f.read() + b'\x03\x00\x01\xff\xff'
+    src = tmp_path / 'short.DTA'
+    src.write_bytes(data)
+
+    path = tmp_path / 'subset.DTA'
+    subset_dta(str(src), str(path), channels=[1], time_range=(0, 1e9))
+    assert path.read_bytes().endswith(b'\x03\x00\x01\xff\xff')